@@ -1,15 +1,50 @@
-from sqlalchemy import select
+from sqlalchemy import select, delete, update, func, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
-from typing import List, Tuple, Optional
+from sqlalchemy.orm import selectinload, raiseload
+from typing import Dict, List, Set, Tuple, Optional
+from collections import Counter, OrderedDict, defaultdict
+from datetime import datetime, timedelta, UTC
 from uuid import UUID
-from .models import Job, JobSource, Application
+import uuid
+import hashlib
+import json
+import time
+from .database import settings
+from .models import Job, JobSource, Application, SearchCache, TermDocumentFrequency
 from .schemas import JobSourceInput, ApplicationCreate, ApplicationUpdate
-from .utils import normalize_company, normalize_title, is_duplicate_job
+from .search import job_search_vector, _as_utc
+from .utils import (
+    is_duplicate_description, fingerprint_distance,
+    preprocess_job, PreprocessedJob, term_frequencies
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+# candidates whose SimHash fingerprint differs in at most this many bits
+# are compared first, the similarity check still decides
+FINGERPRINT_MAX_DISTANCE = 3
+
+# jobs deduped and committed together during ingest
+INGEST_CHUNK_SIZE = 500
+
+# term_df rows written per statement, keeps under the bind parameter limit
+TERM_DF_PAGE_SIZE = 1000
+
+def _upsert_insert(session: AsyncSession, model):
+    """
+    insert() construct supporting ON CONFLICT for the session's dialect,
+    or None when the dialect has no such clause.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    return None
+
 class JobCRUD:
     """CRUD operations for jobs with deduplication logic."""
 
@@ -35,30 +70,64 @@ class JobCRUD:
         inserted = 0
         merged = 0
 
-        for job_input in jobs:
-            # check if this source job already exists:
-            existing_source = await self._get_job_source(
-                source, job_input.id
+        # commit in chunks so early jobs are visible (and their rows no
+        # longer held in memory) before the rest of a large batch is deduped
+        for start in range(0, len(jobs), INGEST_CHUNK_SIZE):
+            chunk_inserted, chunk_merged = await self._ingest_chunk(
+                source, jobs[start:start + INGEST_CHUNK_SIZE]
             )
+            inserted += chunk_inserted
+            merged += chunk_merged
 
-            if existing_source:
+        return inserted, merged
+    
+    async def _ingest_chunk(
+            self,
+            source: str,
+            jobs: List[JobSourceInput]
+    ) -> Tuple[int, int]:
+        """
+        Dedup and write one chunk of an ingest batch in a single commit.
+
+        Jobs committed by earlier chunks are picked up by the existence
+        and candidate queries like any other stored job.
+        """
+        # collected locally and written with a single flush at the end
+        pending_jobs = []
+        pending_sources = []
+        # (source, source_job_id) -> job created for it in this batch
+        new_jobs = {}
+
+        # normalize and fingerprint everything up front for the bulk lookups below
+        prepared = [
+            preprocess_job(job_input.company, job_input.title, job_input.description)
+            for job_input in jobs
+        ]
+
+        # one query each for already ingested source ids and dedup candidates
+        existing_ids = await self._get_existing_source_ids(
+            source, [job_input.id for job_input in jobs]
+        )
+        candidates = await self._get_candidates({
+            (job.normalized_company, job.normalized_title) for job in prepared
+        })
+
+        for job_input, job in zip(jobs, prepared):
+            # check if this source job already exists:
+            if job_input.id in existing_ids:
                 logger.info(f"Job {job_input.id} from {source} already exists")
                 continue
-            
-            # normalize for deduplication
-            norm_company = normalize_company(job_input.company)
-            norm_title = normalize_title(job_input.title)
+            existing_ids.add(job_input.id)
 
             # check for duplicate across sources
-            duplicate_job = await self._find_duplicate(
-                norm_company,
-                norm_title,
-                job_input.description
+            bucket = candidates.setdefault(
+                (job.normalized_company, job.normalized_title), []
             )
+            duplicate_job = self._find_duplicate(job, bucket)
 
             if duplicate_job:
                 # Merge: add new source to existing job
-                await self._add_job_source(
+                pending_sources.append(self._add_job_source(
                     duplicate_job.id,
                     # note source is directly passed when dupe, but below when inserting new job
                     # source is not passed but job_input alone is passed, and the source
@@ -67,59 +136,204 @@ class JobCRUD:
                     source, 
                     job_input.id,
                     job_input.url
-                )
-                merged += 1
+                ))
                 logger.info(f"Merged job {job_input.id} into existing job {duplicate_job.id}")
             else:
                 # insert new job
-                await self._create_job(job_input, norm_company, norm_title)
-                inserted += 1
+                new_job, job_source = self._create_job(
+                    job_input,
+                    job.normalized_company,
+                    job.normalized_title,
+                    job.fingerprint
+                )
+                pending_jobs.append(new_job)
+                pending_sources.append(job_source)
+                new_jobs[(job_source["source"], job_source["source_job_id"])] = new_job
+                # later jobs in the same batch can be duplicates of this one
+                bucket.append(new_job)
                 logger.info(f"Inserted new job {job_input.id}")
 
+        self.session.add_all(pending_jobs)
+        await self.session.flush()
+
+        if pending_jobs and self.session.get_bind().dialect.name == "postgresql":
+            # full text search reads jobs.search_vector
+            await self.session.execute(
+                update(Job)
+                .filter(Job.id.in_([job.id for job in pending_jobs]))
+                .values(search_vector = job_search_vector())
+                .execution_options(synchronize_session = False)
+            )
+
+        written = await self._insert_job_sources(pending_sources)
+
+        # a concurrent ingest may have claimed a source id after the existence
+        # check, drop the jobs that were created for those rows
+        orphaned = {
+            key: job for key, job in new_jobs.items() if key not in written
+        }
+        if orphaned:
+            dropped = await self._drop_orphaned_jobs(orphaned)
+            for key in dropped:
+                del new_jobs[key]
+
+        inserted = len(new_jobs)
+        merged = len(written) - sum(key in written for key in new_jobs)
+
+        if self.session.get_bind().dialect.name != "postgresql":
+            # idf for the python relevance scoring, postgres ranks with tsvector
+            await self._add_document_frequencies(list(new_jobs.values()))
+
         await self.session.commit()
 
         return inserted, merged
     
-    async def _get_job_source(
+    async def _drop_orphaned_jobs(
+            self,
+            orphaned: Dict[Tuple[str, str], Job]
+    ) -> Set[Tuple[str, str]]:
+        """
+        Delete jobs created in this batch whose own source row lost to a
+        concurrent ingest.
+
+        Later jobs of the batch may already have merged into such a job,
+        their source rows are moved to the job that won the source id
+        first. A job whose winner can't be found is kept.
+
+        Returns the (source, source_job_id) keys of the deleted jobs.
+        """
+        result = await self.session.execute(
+            select(JobSource.source, JobSource.source_job_id, JobSource.job_id)
+            .filter(tuple_(JobSource.source, JobSource.source_job_id).in_(list(orphaned)))
+        )
+        winners = {(source, source_job_id): job_id for source, source_job_id, job_id in result.all()}
+
+        dropped = set()
+        for key, job in orphaned.items():
+            if key not in winners:
+                continue
+            await self.session.execute(
+                update(JobSource)
+                .filter(JobSource.job_id == job.id)
+                .values(job_id = winners[key])
+                .execution_options(synchronize_session = False)
+            )
+            dropped.add(key)
+
+        if dropped:
+            logger.info(f"Dropping {len(dropped)} jobs whose source was ingested concurrently")
+            await self.session.execute(
+                delete(Job).filter(Job.id.in_([orphaned[key].id for key in dropped]))
+            )
+        return dropped
+
+    async def _add_document_frequencies(self, jobs: List[Job]):
+        """Count each new job once for every distinct term it contains."""
+        df = Counter()
+        for job in jobs:
+            df.update(job.title_terms.keys() | job.description_terms.keys())
+        if not df:
+            return
+
+        rows = [dict(term = term, df = count) for term, count in df.items()]
+        for start in range(0, len(rows), TERM_DF_PAGE_SIZE):
+            page = rows[start:start + TERM_DF_PAGE_SIZE]
+
+            stmt = _upsert_insert(self.session, TermDocumentFrequency)
+            if stmt is None:
+                result = await self.session.execute(
+                    select(TermDocumentFrequency).filter(
+                        TermDocumentFrequency.term.in_([row["term"] for row in page])
+                    )
+                )
+                existing = {stat.term: stat for stat in result.scalars().all()}
+                for row in page:
+                    if row["term"] in existing:
+                        existing[row["term"]].df += row["df"]
+                    else:
+                        self.session.add(TermDocumentFrequency(**row))
+                continue
+
+            stmt = stmt.values(page)
+            await self.session.execute(stmt.on_conflict_do_update(
+                index_elements = ["term"],
+                set_ = dict(df = TermDocumentFrequency.df + stmt.excluded.df)
+            ))
+
+    async def _get_existing_source_ids(
             self,
             source: str,
-            source_job_id: str
-    ) -> Optional[JobSource]:
-        """Check if a job from this source already exists."""
-        stmt = select(JobSource).filter(
-            JobSource.source == source,
-            JobSource.source_job_id == source_job_id
+            source_job_ids: List[str]
+    ) -> Set[str]:
+        """Get the ids from this source that have already been ingested."""
+        if not source_job_ids:
+            return set()
+
+        stmt = select(JobSource.source_job_id).filter(
+            tuple_(JobSource.source, JobSource.source_job_id).in_(
+                [(source, source_job_id) for source_job_id in source_job_ids]
+            )
         )
         result = await self.session.execute(stmt)
-        return result.scalar_one_or_none()
+        return set(result.scalars().all())
     
-    async def _find_duplicate(
+    async def _get_candidates(
             self,
-            norm_company: str,
-            norm_title: str,
-            description: str
-    ) -> Optional[Job]:
+            keys: Set[Tuple[str, str]]
+    ) -> Dict[Tuple[str, str], List[Job]]:
         """
-        Find potential duplicate jobs.
-        
-        First filter by normalized company and title (fast)
-        Then check description similarity (slow)
+        Get potential duplicate jobs for a batch, bucketed by
+        (normalized_company, normalized_title).
+
+        Every job in a bucket is loaded, `_find_duplicate` makes the call
+        on the fingerprint and description head the same way on every
+        dialect.
+
+        :param keys: (normalized_company, normalized_title) of the incoming jobs
+        :type keys: Set[Tuple[str, str]]
         """
-        # get candidates with same company and title
+        candidates = defaultdict(list)
+        if not keys:
+            return candidates
+
         stmt = select(Job).filter(
-            Job.normalized_company == norm_company,
-            Job.normalized_title == norm_title
+            tuple_(Job.normalized_company, Job.normalized_title).in_(list(keys))
         )
         result = await self.session.execute(stmt)
-        candidates = result.scalars().all()
+
+        for job in result.scalars().all():
+            candidates[(job.normalized_company, job.normalized_title)].append(job)
+
+        return candidates
+    
+    def _find_duplicate(
+            self,
+            job: PreprocessedJob,
+            candidates: List[Job]
+    ) -> Optional[Job]:
+        """
+        Find potential duplicate jobs.
+        
+        Candidates are already filtered by normalized company and title (fast)
+        Near identical description fingerprints are checked first
+        Every match is confirmed by description similarity (slow)
+        """
+        if job.fingerprint is not None:
+            # likely reposts first, so the loop usually ends on the first
+            # candidate. Fingerprints only order, postings sharing a lot of
+            # boilerplate can land within a few bits of each other
+            def is_far(candidate: Job) -> bool:
+                return (
+                    candidate.description_fingerprint is None
+                    or fingerprint_distance(job.fingerprint, candidate.description_fingerprint)
+                        > FINGERPRINT_MAX_DISTANCE
+                )
+            candidates = sorted(candidates, key = is_far)
 
         # check each candidate for similarity
         for candidate in candidates:
-            is_dup, score = is_duplicate_job(
-                norm_company, norm_title, description,
-                candidate.normalized_company,
-                candidate.normalized_title,
-                candidate.description
+            is_dup, score = is_duplicate_description(
+                job.description_head, candidate.description, job.description_shingles
             )
 
             if is_dup:
@@ -128,56 +342,100 @@ class JobCRUD:
             
         return None
     
-    async def _create_job(
+    async def _insert_job_sources(
+            self,
+            rows: List[dict]
+    ) -> Set[Tuple[str, str]]:
+        """
+        Insert job_sources rows, skipping any that hit the unique
+        (source, source_job_id) index.
+
+        Returns the (source, source_job_id) pairs that were actually written.
+        """
+        if not rows:
+            return set()
+
+        stmt = _upsert_insert(self.session, JobSource)
+        if stmt is None:
+            # no ON CONFLICT support, rely on the existence check done by the caller
+            self.session.add_all([JobSource(**row) for row in rows])
+            return {(row["source"], row["source_job_id"]) for row in rows}
+
+        stmt = stmt.values(rows).on_conflict_do_nothing(
+            index_elements = ["source", "source_job_id"]
+        ).returning(JobSource.source, JobSource.source_job_id)
+
+        result = await self.session.execute(stmt)
+        return {tuple(row) for row in result.all()}
+    
+    def _create_job(
             self,
             job_input: JobSourceInput,
             norm_company: str,
-            norm_title: str
-    ) -> Job:
+            norm_title: str,
+            fingerprint: Optional[int]
+    ) -> Tuple[Job, dict]:
         """Create a new job with its first source"""
         job = Job(
+            # generated client side so the source can reference it before flush
+            id = uuid.uuid4(),
             normalized_company = norm_company,
             normalized_title = norm_title,
+            original_company = job_input.company,
             original_title = job_input.title,
             description = job_input.description,
+            description_fingerprint = fingerprint,
+            title_terms = term_frequencies(job_input.title),
+            description_terms = term_frequencies(
+                job_input.description[:settings.description_terms_max_chars]
+            ),
             location = job_input.location,
             date_posted = job_input.date_posted
         )
 
-        self.session.add(job)
-        await self.session.flush() # Get job.id
-
         # add source
-        await self._add_job_source(
+        job_source = self._add_job_source(
             job.id,
             job_input.source,
             job_input.id,
             job_input.url
         )
 
-        return job
+        return job, job_source
     
-    async def _add_job_source(
+    def _add_job_source(
             self,
             job_id: UUID,
             source: str,
             source_job_id: str,
             url: str
-    ):
-        """Add a source to an existing job."""
-        job_source = JobSource(
+    ) -> dict:
+        """Build a job_sources row for an existing job."""
+        return dict(
             job_id = job_id,
             source = source,
             source_job_id = source_job_id,
             url = url
         )
-        self.session.add(job_source)
 
-    async def _get_job_by_id(self, job_id: UUID) -> Optional[Job]:
-        """Get a job by ID with sources and application."""
+    async def _get_job_by_id(
+            self,
+            job_id: UUID,
+            with_application: bool = True
+    ) -> Optional[Job]:
+        """
+        Get a job by ID with sources and application.
+
+        Pass with_application=False when the caller is about to replace
+        the application anyway, which saves its SELECT.
+        """
+        options = [selectinload(Job.sources)]
+        if with_application:
+            options.append(selectinload(Job.application))
+
         stmt = select(Job).filter(Job.id == job_id).options(
-            selectinload(Job.sources),
-            selectinload(Job.application)
+            *options,
+            raiseload("*")
         )
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
@@ -194,27 +452,27 @@ class ApplicationCRUD:
             app_data: ApplicationCreate
     ) -> Application:
         """Create or Update an Application"""
-        # check if application exists
-        stmt = select(Application).filter(Application.job_id == job_id)
-        result = await self.session.execute(stmt)
-        application = result.scalar_one_or_none()
-
-        if application:
-            # update existing
-            application.status = app_data.status
-            if app_data.notes is not None:
-                application.notes = app_data.notes
-        else:
-            # create new
-            application = Application(
-                job_id = job_id,
-                status = app_data.status,
-                notes = app_data.notes
+        # single INSERT ... ON CONFLICT (job_id) DO UPDATE, keeping the
+        # existing notes when none are given
+        stmt = _upsert_insert(self.session, Application).values(
+            job_id = job_id,
+            status = app_data.status,
+            notes = app_data.notes
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements = ["job_id"],
+            set_ = dict(
+                status = stmt.excluded.status,
+                notes = func.coalesce(stmt.excluded.notes, Application.notes),
+                updated_at = func.now()
             )
-            self.session.add(application)
+        ).returning(Application)
 
+        result = await self.session.execute(
+            stmt, execution_options = {"populate_existing": True}
+        )
+        application = result.scalar_one()
         await self.session.commit()
-        await self.session.refresh(application)
 
         return application
     
@@ -242,14 +500,57 @@ class ApplicationCRUD:
 
         return application
 
-    async def get_all(self) -> List[Application]:
-        """Get all tracked applications."""
-        stmt = select(Application).options(
-            selectinload(Application.job).selectinload(Job.sources)
-        ).order_by(Application.updated_at.desc())
+    async def get_all(self) -> List[dict]:
+        """
+        Get all tracked applications, shaped like ApplicationResponse.
+
+        Only the columns the listing shows are selected, so job
+        descriptions are never read. Sources for all listed jobs are
+        fetched with one extra query.
+        """
+        stmt = select(
+            Application.job_id,
+            Application.status,
+            Application.notes,
+            Application.updated_at,
+            Job.normalized_company,
+            Job.original_title,
+            Job.location,
+            Job.date_posted
+        ).join(Job, Application.job_id == Job.id).order_by(Application.updated_at.desc())
 
         result = await self.session.execute(stmt)
-        return result.scalars().all()
+        rows = result.all()
+
+        sources = defaultdict(list)
+        if rows:
+            source_stmt = select(
+                JobSource.job_id, JobSource.source, JobSource.url
+            ).filter(JobSource.job_id.in_([row.job_id for row in rows]))
+
+            for source_row in (await self.session.execute(source_stmt)).all():
+                sources[source_row.job_id].append(
+                    {"source": source_row.source, "url": source_row.url}
+                )
+
+        return [
+            {
+                "job_id": row.job_id,
+                "status": row.status,
+                "notes": row.notes,
+                "updated_at": row.updated_at,
+                "job": {
+                    "job_id": row.job_id,
+                    "company": Job.format_company(row.normalized_company),
+                    "title": row.original_title,
+                    "location": row.location,
+                    "date_posted": row.date_posted,
+                    "sources": sources[row.job_id],
+                    "application_status": row.status
+                }
+            }
+            for row in rows
+        ]
     
     async def delete(self, job_id: UUID) -> bool:
         """Delete an application."""
@@ -263,4 +564,121 @@ class ApplicationCRUD:
         await self.session.delete(application)
         await self.session.commit()
 
-        return True
\ No newline at end of file
+        return True
+
+
+# process-local LRU in front of the search_cache table: query_hash ->
+# (updated_at of the row the response came from, when that row was last
+# seen, response)
+_local_search_cache: Dict[str, Tuple[datetime, float, dict]] = OrderedDict()
+
+def _remember_search(query_hash: str, version: datetime, response: dict):
+    _local_search_cache[query_hash] = (_as_utc(version), time.monotonic(), response)
+    _local_search_cache.move_to_end(query_hash)
+    while len(_local_search_cache) > settings.search_cache_local_max_entries:
+        _local_search_cache.popitem(last = False)
+
+class SearchCacheCRUD:
+    """
+    Cache of serialized search responses.
+
+    The search_cache table is shared by every API process. Entries expire
+    after settings.search_cache_ttl_seconds (results depend on the current
+    time through the days filter and recency boost) and are cleared
+    whenever jobs or applications change.
+
+    Each process also keeps the most recent responses in a bounded LRU.
+    For settings.search_cache_local_ttl_seconds a local copy is served
+    without touching the database. After that it is only served while the
+    table still holds the row it was taken from (same updated_at), a
+    lookup of that one column, so a clear or a newer response from another
+    process is picked up within the local TTL.
+
+    Lookups never write, a failed write of a new response is logged and
+    the search result is still returned.
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    @staticmethod
+    def query_hash(params: dict) -> str:
+        """Stable hash of the search parameters."""
+        return hashlib.sha256(
+            json.dumps(params, sort_keys = True, default = str).encode()
+        ).hexdigest()
+
+    async def get(self, params: dict) -> Optional[dict]:
+        """Get a cached response for these search parameters."""
+        query_hash = self.query_hash(params)
+        cutoff = datetime.now(UTC) - timedelta(seconds = settings.search_cache_ttl_seconds)
+
+        entry = _local_search_cache.get(query_hash)
+        if entry and time.monotonic() - entry[1] < settings.search_cache_local_ttl_seconds:
+            _local_search_cache.move_to_end(query_hash)
+            return entry[2]
+
+        if entry:
+            version = await self.session.scalar(
+                select(SearchCache.updated_at).filter(
+                    SearchCache.query_hash == query_hash,
+                    SearchCache.updated_at >= cutoff
+                )
+            )
+            if version is not None and _as_utc(version) == entry[0]:
+                _remember_search(query_hash, version, entry[2])
+                return entry[2]
+
+            # expired, cleared or replaced by another process
+            del _local_search_cache[query_hash]
+            if version is None:
+                return None
+
+        stmt = select(SearchCache).filter(
+            SearchCache.query_hash == query_hash,
+            SearchCache.updated_at >= cutoff
+        )
+        result = await self.session.execute(stmt)
+        cached = result.scalar_one_or_none()
+
+        if not cached:
+            return None
+
+        _remember_search(query_hash, cached.updated_at, cached.results)
+        return cached.results
+
+    async def set(self, params: dict, response: dict):
+        """Store a serialized search response, logging instead of raising on failure."""
+        query_hash = self.query_hash(params)
+
+        now = datetime.now(UTC)
+        stmt = _upsert_insert(self.session, SearchCache).values(
+            query_hash = query_hash,
+            query_params = params,
+            results = response,
+            created_at = now,
+            updated_at = now
+        )
+        try:
+            await self.session.execute(stmt.on_conflict_do_update(
+                index_elements = ["query_hash"],
+                set_ = dict(
+                    results = stmt.excluded.results,
+                    updated_at = stmt.excluded.updated_at
+                )
+            ))
+            await self.session.commit()
+        except SQLAlchemyError as e:
+            # the response is already built, a cache miss next time is fine
+            logger.warning(f"Could not cache search results: {str(e)}")
+            await self.session.rollback()
+            return
+
+        _remember_search(query_hash, now, response)
+
+    async def clear(self):
+        """Drop every cached search, called after jobs or applications change."""
+        # other processes notice the deleted rows on their next lookup
+        _local_search_cache.clear()
+        await self.session.execute(delete(SearchCache))
+        await self.session.commit()
@@ -1,10 +1,75 @@
+import sys
+from sqlalchemy import text, select, and_
 from .database import sync_engine, Base
-from .models import Job, JobSource, Application, SearchCache
+from .models import Job, JobSource, Application, SearchCache, TermDocumentFrequency
+from .search import job_search_vector
+from .utils import normalize_company
+
+def _renormalized_company(normalized: str, original: str = None) -> str:
+    """
+    normalized_company under the current normalize_company.
+
+    Built from the ingested name when the job kept it. Older jobs only
+    have the stored value, normalizing it again strips what the old rules
+    left behind ("foo inc" from "Foo Inc Co"). A suffix the old rules glued
+    on ("stripeinc" from "Stripe,Inc.") can't be told apart from a real
+    name and stays.
+    """
+    return normalize_company(original if original is not None else normalized)
+
+def renormalize_companies():
+    """
+    One-off migration of normalized_company after normalize_company changed,
+    run by hand with --renormalize-companies.
+    """
+    print("renormalizing company names...")
+    with sync_engine.begin() as conn:
+        rows = conn.execute(
+            select(Job.normalized_company, Job.original_company).distinct()
+        ).all()
+        for normalized, original in rows:
+            renormalized = _renormalized_company(normalized, original)
+            if renormalized == normalized:
+                continue
+            print(f"company {original or normalized!r}: {normalized!r} -> {renormalized!r}")
+            conn.execute(
+                Job.__table__.update()
+                .where(and_(
+                    Job.normalized_company == normalized,
+                    Job.original_company.is_(None) if original is None
+                    else Job.original_company == original
+                ))
+                .values(normalized_company = renormalized)
+            )
+    print("company names renormalized")
 
 def init_db():
     print("creating database tables...")
+    if sync_engine.dialect.name == "postgresql":
+        # trigram index on jobs.location relies on pg_trgm
+        with sync_engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
     Base.metadata.create_all(bind = sync_engine)
+    if sync_engine.dialect.name == "postgresql":
+        # the description trigram prefilter for dedup candidates was removed
+        with sync_engine.begin() as conn:
+            conn.execute(text("DROP INDEX IF EXISTS idx_job_desc_trgm"))
+        # create_all doesn't add columns to an existing jobs table
+        with sync_engine.begin() as conn:
+            conn.execute(text(
+                "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS original_company VARCHAR(255)"
+            ))
+        # fill search vectors for jobs ingested before they were maintained
+        with sync_engine.begin() as conn:
+            conn.execute(
+                Job.__table__.update()
+                .where(Job.search_vector.is_(None))
+                .values(search_vector = job_search_vector())
+            )
     print("database tables created successfully")
 
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    if "--renormalize-companies" in sys.argv[1:]:
+        renormalize_companies()
+    else:
+        init_db()
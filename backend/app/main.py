@@ -1,24 +1,31 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Optional
+from sqlalchemy.orm.attributes import set_committed_value
+from typing import List, Optional
 from uuid import UUID
+from pydantic import TypeAdapter, ValidationError
 import logging
 
 from .database import get_db
 from .schemas import (
     JobIngestRequest, JobIngestResponse,
     JobSearchResponse, JobSearchResult, JobDetailResponse,
-    ApplicationCreate, ApplicationUpdate, ApplicationResponse,
-    JobSourceResponse
+    ApplicationCreate, ApplicationUpdate, ApplicationResponse
 )
-from .crud import JobCRUD, ApplicationCRUD
+from .crud import JobCRUD, ApplicationCRUD, SearchCacheCRUD
 from .search import JobSearchEngine
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# built once, validates a whole page of Job rows in a single call
+search_results_adapter = TypeAdapter(List[JobSearchResult])
+applications_adapter = TypeAdapter(List[ApplicationResponse])
+ingest_request_adapter = TypeAdapter(JobIngestRequest)
+
 app = FastAPI(
     title = "Job Aggregator API",
     description = "Job application aggregation and search platform",
@@ -57,9 +64,51 @@ async def health_check():
 # Job Ingestion Endpoints
 # ============================================================================
 
-@app.post("/jobs/ingest", response_model = JobIngestResponse)
+def _inline_schema_refs(schema: dict, defs: Optional[dict] = None):
+    """Resolve pydantic's local $defs refs so a schema can sit in openapi_extra."""
+    if defs is None:
+        schema = dict(schema)
+        defs = schema.pop("$defs", {})
+
+    if isinstance(schema, dict):
+        ref = schema.get("$ref", "")
+        if ref.startswith("#/$defs/"):
+            return _inline_schema_refs(defs[ref.split("/")[-1]], defs)
+        return {key: _inline_schema_refs(value, defs) for key, value in schema.items()}
+    if isinstance(schema, list):
+        return [_inline_schema_refs(item, defs) for item in schema]
+    return schema
+
+async def parse_ingest_request(request: Request) -> JobIngestRequest:
+    """
+    Validate the raw ingest body with pydantic-core's JSON parser,
+    skipping the intermediate Python dict for large job lists.
+    """
+    try:
+        return ingest_request_adapter.validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError([
+            {**error, "loc": ("body", *error["loc"])}
+            for error in e.errors(include_url = False)
+        ])
+
+@app.post(
+    "/jobs/ingest",
+    response_model = JobIngestResponse,
+    # body is parsed by parse_ingest_request, document it by hand
+    openapi_extra = {
+        "requestBody": {
+            "content": {
+                "application/json": {
+                    "schema": _inline_schema_refs(JobIngestRequest.model_json_schema())
+                }
+            },
+            "required": True
+        }
+    }
+)
 async def injest_jobs(
-    request: JobIngestRequest,
+    request: JobIngestRequest = Depends(parse_ingest_request),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -73,6 +122,9 @@ async def injest_jobs(
         crud = JobCRUD(db)
         inserted, merged = await crud.ingest_jobs(request.source, request.jobs)
 
+        if inserted or merged:
+            await SearchCacheCRUD(db).clear()
+
         return JobIngestResponse(
             inserted = inserted,
             merged = merged,
@@ -113,6 +165,15 @@ async def search_jobs(
     - Exclusion terms hard filter results
     """
     try:
+        search_cache = SearchCacheCRUD(db)
+        params = dict(
+            q = q, company = company, location = location, days = days,
+            source = source, sort = sort, page = page, page_size = page_size
+        )
+        cached = await search_cache.get(params)
+        if cached is not None:
+            return cached
+
         search_engine = JobSearchEngine(db)
         results, total = await search_engine.search(
             query = q,
@@ -126,28 +187,21 @@ async def search_jobs(
         )
 
         # Convert to response format
-        job_results = []
-        for job, score in results:
-            job_results.append(JobSearchResult(
-                job_id = job.id,
-                company = job.normalized_company.title(),
-                title = job.original_title,
-                location = job.location,
-                date_posted = job.date_posted,
-                relevance_score = round(score, 3) if score else None,
-                sources = [
-                    JobSourceResponse(source = s.source, url = s.url)
-                    for s in job.sources
-                ],
-                application_status = job.application.status if job.application else None
-            ))
-
-        return JobSearchResponse(
+        job_results = search_results_adapter.validate_python(
+            [job for job, _ in results], from_attributes = True
+        )
+        for job_result, (_, score) in zip(job_results, results):
+            job_result.relevance_score = round(score, 3) if score else None
+
+        response = JobSearchResponse(
             results = job_results,
             total = total,
             page = page,
             page_size = page_size
         )
+        await search_cache.set(params, response.model_dump(mode = "json"))
+
+        return response
     except Exception as e:
         logger.error(f"Error searching jobs: {str(e)}")
         raise HTTPException(status_code = 500, detail = str(e))
@@ -167,21 +221,7 @@ async def get_job(
         if not job:
             raise HTTPException(status_code = 404, detail = "Job not found")
         
-        return JobDetailResponse(
-            job_id = job.id,
-            company = job.normalized_company.title(),
-            title = job.original_title,
-            description = job.description,
-            location = job.location,
-            date_posted = job.date_posted,
-            created_at = job.created_at,
-            sources = [
-                JobSourceResponse(source = s.source, url = s.url)
-                for s in job.sources
-            ],
-            application_status = job.application.status if job.application else None,
-            application_notes = job.application.notes if job.application else None
-        )
+        return JobDetailResponse.model_validate(job)
     except HTTPException:
         raise
     except Exception as e:
@@ -209,9 +249,9 @@ async def create_or_update_application(
     - Offer
     """
     try:
-        # verify job exists
+        # verify job exists, its application is set from the upsert below
         job_crud = JobCRUD(db)
-        job = await job_crud._get_job_by_id(job_id)
+        job = await job_crud._get_job_by_id(job_id, with_application = False)
 
         if not job:
             raise HTTPException(status_code = 404, detail = "Job not found")
@@ -220,26 +260,19 @@ async def create_or_update_application(
         app_crud = ApplicationCRUD(db)
         application = await app_crud.create_or_update(job_id, app_data)
 
-        # Refresh job to get updated application
-        await db.refresh(job, ['application', 'sources'])
+        # sources were eager loaded with the job, only the application
+        # changed and we already have it, so link it instead of refreshing
+        set_committed_value(job, "application", application)
+
+        # search results carry the application status
+        await SearchCacheCRUD(db).clear()
 
         return ApplicationResponse(
             job_id=application.job_id,
             status=application.status,
             notes=application.notes,
             updated_at=application.updated_at,
-            job=JobSearchResult(
-                job_id=job.id,
-                company=job.normalized_company.title(),
-                title=job.original_title,
-                location=job.location,
-                date_posted=job.date_posted,
-                sources=[
-                    JobSourceResponse(source=s.source, url=s.url)
-                    for s in job.sources
-                ],
-                application_status=application.status
-            )
+            job=JobSearchResult.model_validate(job)
         )
     except HTTPException:
         raise
@@ -258,27 +291,7 @@ async def get_applications(
         app_crud = ApplicationCRUD(db)
         applications = await app_crud.get_all()
 
-        return [
-            ApplicationResponse(
-                job_id=app.job_id,
-                status=app.status,
-                notes=app.notes,
-                updated_at=app.updated_at,
-                job=JobSearchResult(
-                    job_id=app.job.id,
-                    company=app.job.normalized_company.title(),
-                    title=app.job.original_title,
-                    location=app.job.location,
-                    date_posted=app.job.date_posted,
-                    sources=[
-                        JobSourceResponse(source=s.source, url=s.url)
-                        for s in app.job.sources
-                    ],
-                    application_status=app.status
-                )
-            )
-            for app in applications
-        ]
+        return applications_adapter.validate_python(applications)
     except Exception as e:
         logger.error(f"Error getting applications: {str(e)}")
         raise HTTPException(status_code = 500, detail = str(e))
@@ -298,6 +311,8 @@ async def delete_application(
         if not deleted:
             raise HTTPException(status_code = 404, detail = "Application not found")
         
+        await SearchCacheCRUD(db).clear()
+
         return {"message": "Application deleted"}
     except HTTPException:
         raise
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Integer, Float, Index, func, JSON
+from sqlalchemy import String, Text, DateTime, ForeignKey, Integer, BigInteger, Index, func, JSON
 from sqlalchemy.dialects.postgresql import UUID, JSONB, TSVECTOR
-from sqlalchemy.orm import relationship, mapped_column
-from datetime import datetime, UTC
+from sqlalchemy.orm import Mapped, relationship, mapped_column
+from datetime import datetime
+from typing import Any, List, Optional
 import uuid
 from .database import Base
 
@@ -10,75 +11,126 @@ from .database import Base
 class Job(Base):
     __tablename__ = "jobs"
 
-    id = Column(UUID(as_uuid=True), primary_key = True, default = uuid.uuid4)
-    normalized_company = Column(String(255), nullable = False, index = True)
-    normalized_title = Column(String(255), nullable = False, index = True)
-    original_title = Column(String(255), nullable = False)
-    description = Column(Text, nullable = False)
-    location = Column(String(255), index = True)
-    date_posted = Column(DateTime(timezone=True), nullable = False, index = True)
-    created_at = Column(DateTime(timezone=True), default = datetime.now(UTC), nullable = False)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid = True), primary_key = True, default = uuid.uuid4)
+    normalized_company: Mapped[str] = mapped_column(String(255), nullable = False, index = True)
+    normalized_title: Mapped[str] = mapped_column(String(255), nullable = False, index = True)
+    original_title: Mapped[str] = mapped_column(String(255), nullable = False)
+    # as ingested, so normalized_company can be rebuilt when normalization changes
+    # (null for jobs ingested before it was kept)
+    original_company: Mapped[Optional[str]] = mapped_column(String(255))
+    description: Mapped[str] = mapped_column(Text, nullable = False)
+    # SimHash of the description, see utils.description_fingerprint
+    description_fingerprint: Mapped[Optional[int]] = mapped_column(BigInteger, index = True)
+    location: Mapped[Optional[str]] = mapped_column(String(255), index = True)
+    date_posted: Mapped[datetime] = mapped_column(DateTime(timezone = True), nullable = False, index = True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone = True), server_default = func.now(), nullable = False)
+
+    # token -> count for the title and description, see utils.term_frequencies
+    title_terms: Mapped[Optional[dict]] = mapped_column(JSONB().with_variant(JSON(), "sqlite"))
+    description_terms: Mapped[Optional[dict]] = mapped_column(JSONB().with_variant(JSON(), "sqlite"))
 
     # PostgreSQL full-text search
-    search_vector = mapped_column(
+    search_vector: Mapped[Optional[str]] = mapped_column(
         TSVECTOR().with_variant(Text(), "sqlite"),
         nullable=True
     )
 
     # Relationships
-    sources = relationship("JobSource", back_populates = "job", cascade = "all, delete-orphan")
-    application = relationship("Application", back_populates = "job", uselist = False, cascade = "all, delete-orphan")
+    sources: Mapped[List["JobSource"]] = relationship(back_populates = "job", cascade = "all, delete-orphan")
+    application: Mapped[Optional["Application"]] = relationship(back_populates = "job", uselist = False, cascade = "all, delete-orphan")
+
+    # fetch server generated created_at on INSERT so it is never lazy loaded
+    __mapper_args__ = {"eager_defaults": True}
+
+    @staticmethod
+    def format_company(normalized_company: str) -> str:
+        """Company name as shown in API responses, for rows selected without a Job."""
+        return normalized_company.title()
+
+    @property
+    def display_company(self) -> str:
+        """Company name as shown in API responses."""
+        return Job.format_company(self.normalized_company)
 
     # Indexes for search performance
     __table_args__ = (
         Index('idx_search_vector', 'search_vector', postgresql_using = 'gin'),
         Index('idx_company_title', 'normalized_company', 'normalized_title'),
+        # company filter is a LIKE 'prefix%' on the normalized name
+        Index(
+            'idx_company_prefix', 'normalized_company',
+            postgresql_ops = {'normalized_company': 'text_pattern_ops'}
+        ),
+        # location filter is a case insensitive substring match
+        Index(
+            'idx_location_trgm', 'location',
+            postgresql_using = 'gin',
+            postgresql_ops = {'location': 'gin_trgm_ops'}
+        ),
         Index('idx_date_posted_desc', date_posted.desc()),
     )
 
 class JobSource(Base):
     __tablename__ = "job_sources"
 
-    id = Column(Integer, primary_key = True, autoincrement = True)
-    job_id = Column(UUID(as_uuid = True), ForeignKey('jobs.id', ondelete = 'CASCADE'), nullable = False)
-    source = Column(String(50), nullable = False, index = True)
-    source_job_id = Column(String(255), nullable = False)
-    url = Column(Text, nullable = False)
-    created_at = Column(DateTime(timezone=True), default = datetime.now(UTC), nullable = False)
+    id: Mapped[int] = mapped_column(Integer, primary_key = True, autoincrement = True)
+    job_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid = True), ForeignKey('jobs.id', ondelete = 'CASCADE'), nullable = False)
+    source: Mapped[str] = mapped_column(String(50), nullable = False, index = True)
+    source_job_id: Mapped[str] = mapped_column(String(255), nullable = False)
+    url: Mapped[str] = mapped_column(Text, nullable = False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone = True), server_default = func.now(), nullable = False)
 
     # relationship
-    job = relationship("Job", back_populates = "sources")
+    job: Mapped["Job"] = relationship(back_populates = "sources")
 
     __table_args__ = (
         Index('idx_source_job_id', 'source', 'source_job_id', unique = True),
+        # covers the applications listing source lookup (index-only scan on postgres)
+        Index('idx_jobsource_jobid_include', 'job_id', postgresql_include = ['source', 'url']),
     )
 
 class Application(Base):
     __tablename__ = "applications"
 
-    id = Column(UUID(as_uuid = True), primary_key = True, default = uuid.uuid4)
-    job_id = Column(UUID(as_uuid = True), ForeignKey('jobs.id', ondelete = 'CASCADE'), nullable = False, unique = True)
-    status = Column(String(50), nullable = False, default = 'Not Applied', index = True)
-    notes = Column(Text)
-    created_at = Column(DateTime(timezone=True), default = datetime.now(UTC), nullable = False)
-    updated_at = Column(DateTime(timezone=True), default = datetime.now(UTC), onupdate = datetime.now(UTC), nullable = False)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid = True), primary_key = True, default = uuid.uuid4)
+    job_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid = True), ForeignKey('jobs.id', ondelete = 'CASCADE'), nullable = False, unique = True)
+    status: Mapped[str] = mapped_column(String(50), nullable = False, default = 'Not Applied', index = True)
+    notes: Mapped[Optional[str]] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone = True), server_default = func.now(), nullable = False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone = True), server_default = func.now(), onupdate = func.now(), nullable = False)
 
     # Relationship
-    job = relationship("Job", back_populates = "application")
+    job: Mapped["Job"] = relationship(back_populates = "application")
+
+    # fetch server generated timestamps on INSERT/UPDATE so they are
+    # never lazy loaded later
+    __mapper_args__ = {"eager_defaults": True}
+
+    __table_args__ = (
+        # applications listing is ordered by most recently updated
+        Index('idx_app_updated_desc', updated_at.desc()),
+    )
 
 class SearchCache(Base):
     __tablename__ = "search_cache"
     
-    id = Column(Integer, primary_key = True, autoincrement = True)
-    query_hash = Column(String(64), unique = True, nullable = False, index = True)
-    query_params = mapped_column(
+    id: Mapped[int] = mapped_column(Integer, primary_key = True, autoincrement = True)
+    query_hash: Mapped[str] = mapped_column(String(64), unique = True, nullable = False, index = True)
+    query_params: Mapped[Any] = mapped_column(
         JSONB().with_variant(JSON(), "sqlite"),
         nullable=False
     )
-    results = mapped_column(
+    results: Mapped[Any] = mapped_column(
         JSONB().with_variant(JSON(), "sqlite"),
         nullable=False
     )
-    hit_count = Column(Integer, default = 1)
-    created_at = Column(DateTime(timezone=True), default = datetime.now(UTC), nullable = False)
-    updated_at = Column(DateTime(timezone=True), default = datetime.now(UTC), onupdate = datetime.now(UTC), nullable = False)
\ No newline at end of file
+    hit_count: Mapped[Optional[int]] = mapped_column(Integer, default = 1)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone = True), server_default = func.now(), nullable = False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone = True), server_default = func.now(), onupdate = func.now(), nullable = False)
+
+class TermDocumentFrequency(Base):
+    __tablename__ = "term_df"
+
+    # number of jobs whose title or description contains the term
+    term: Mapped[str] = mapped_column(Text, primary_key = True)
+    df: Mapped[int] = mapped_column(Integer, nullable = False, default = 0)
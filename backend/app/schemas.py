@@ -1,4 +1,4 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field, AliasChoices, AliasPath
 from datetime import datetime
 from typing import List, Optional, Literal
 from uuid import UUID
@@ -29,15 +29,19 @@ class JobSourceResponse(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+# aliases let the response models validate straight from a Job row
 class JobSearchResult(BaseModel):
-    job_id: UUID
-    company: str
-    title: str
+    job_id: UUID = Field(validation_alias = AliasChoices("job_id", "id"))
+    company: str = Field(validation_alias = AliasChoices("company", "display_company"))
+    title: str = Field(validation_alias = AliasChoices("title", "original_title"))
     location: str
     date_posted: datetime
     relevance_score: Optional[float] = None
     sources: List[JobSourceResponse]
-    application_status: Optional[str] = None
+    application_status: Optional[str] = Field(
+        None,
+        validation_alias = AliasChoices("application_status", AliasPath("application", "status"))
+    )
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -48,16 +52,22 @@ class JobSearchResponse(BaseModel):
     page_size: int
 
 class JobDetailResponse(BaseModel):
-    job_id: UUID
-    company: str
-    title: str
+    job_id: UUID = Field(validation_alias = AliasChoices("job_id", "id"))
+    company: str = Field(validation_alias = AliasChoices("company", "display_company"))
+    title: str = Field(validation_alias = AliasChoices("title", "original_title"))
     description: str
     location: str
     date_posted: datetime
     created_at: datetime
     sources: List[JobSourceResponse]
-    application_status: Optional[str] = None
-    application_notes: Optional[str] = None
+    application_status: Optional[str] = Field(
+        None,
+        validation_alias = AliasChoices("application_status", AliasPath("application", "status"))
+    )
+    application_notes: Optional[str] = Field(
+        None,
+        validation_alias = AliasChoices("application_notes", AliasPath("application", "notes"))
+    )
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -1,12 +1,42 @@
-from sqlalchemy import select, func, or_, and_, text
+from sqlalchemy import select, func, or_, and_, text, case, literal_column, ColumnElement
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, raiseload
 from datetime import datetime, timedelta, UTC
-from typing import List, Optional
-from .models import Job, JobSource, Application
-from .utils import extract_exclusion_terms, tokenize_for_search
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from .database import settings
+from .models import Job, JobSource, Application, TermDocumentFrequency
+from .utils import (
+    extract_exclusion_terms, tokenize_for_search, term_frequencies, normalize_company
+)
+import heapq
 import math
 
+# text search configuration used for jobs.search_vector and queries
+SEARCH_CONFIG = "english"
+
+# ts_rank_cd weights for the D, C, B, A labels, the title is labelled B and
+# the description A so description matches count 3x title matches
+RANK_WEIGHTS = literal_column("'{0, 0, 0.333, 1.0}'::float4[]")
+
+def job_search_vector() -> ColumnElement:
+    """SQL expression for a job's tsvector, written to jobs.search_vector on PostgreSQL."""
+    return func.setweight(
+        func.to_tsvector(SEARCH_CONFIG, Job.original_title), literal_column("'B'")
+    ).op("||")(
+        func.setweight(
+            func.to_tsvector(SEARCH_CONFIG, Job.description), literal_column("'A'")
+        )
+    )
+
+def _as_utc(value: datetime) -> datetime:
+    # sqlite hands back naive datetimes, they are stored as UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo = UTC)
+    return value
+
+# rows fetched per round trip while scoring in python
+SCORING_BATCH_SIZE = 500
+
 class JobSearchEngine:
     """
     Search engine with relevance scoring and exclusion support.
@@ -14,7 +44,8 @@ class JobSearchEngine:
     Scoring Algorithm:
     - Title matches: weight = 1.0
     - Description matches: weight = 3.0
-    - Term Frequency (TF) considered
+    - Term Frequency (TF) considered, scaled by the term's IDF so rare
+      terms outweigh common ones like "engineer"
     - Recency boost: jobs posted in the last 7 days get small boost
     - Exclusion terms: hard filter, removes results even with high relevance
     """
@@ -39,145 +70,342 @@ class JobSearchEngine:
         returns (results, total_count)
         """
         # Parse query for exclusions
-        exclusion_terms = []
-        search_terms = []
+        exclusion_terms = ()
+        search_terms = ()
 
         if query:
             cleaned_query, exclusion_terms = extract_exclusion_terms(query)
             search_terms = tokenize_for_search(cleaned_query)
         
-        # build base query
-        stmt = select(Job).options(
-            selectinload(Job.sources),
-            selectinload(Job.application)
-        )
+        # build base query, relationships are loaded for the returned page only
+        stmt = select(Job)
 
         # apply filters
         filters = []
 
-        # company filter
+        # company filter, prefix of the normalized name so the index applies
         if company:
-            filters.append(Job.normalized_company.ilike(f"%{company.lower()}%"))
+            filters.append(Job.normalized_company.startswith(
+                normalize_company(company), autoescape = True
+            ))
 
-        # location filter
+        # location filter (trigram indexed on postgres)
         if location:
-            filters.append(Job.location.ilike(f"%{location.lower()}%"))
+            filters.append(Job.location.icontains(location, autoescape = True))
         
         # date filter
         if days:
             cutoff_date = datetime.now(UTC) - timedelta(days = days)
             filters.append(Job.date_posted >= cutoff_date)
 
-        # source filter
+        # source filter, EXISTS instead of a join so jobs aren't repeated
         if source:
-            stmt = stmt.join(JobSource).filter(JobSource.source == source)
+            filters.append(Job.sources.any(JobSource.source == source))
         
         if filters:
             stmt = stmt.filter(and_(*filters))
 
-        # get all matching jobs for scoring
-        result = await self.session.execute(stmt)
-        jobs = result.scalars().unique().all()
+        if not search_terms and not exclusion_terms:
+            return await self._browse(stmt, page, page_size)
+
+        if self.session.get_bind().dialect.name == "postgresql":
+            return await self._search_postgres(
+                stmt, search_terms, exclusion_terms, sort, page, page_size
+            )
+
+        term_weights = []
+        if search_terms:
+            term_weights = self._term_weights(
+                search_terms, await self._get_idf(search_terms)
+            )
+
+        # parsed once per request rather than per job
+        excluded = set(exclusion_terms)
+        now_ts = datetime.now(UTC).timestamp()
+
+        # stream matching jobs for scoring instead of materializing them all
+        result = await self.session.stream(
+            stmt.options(raiseload("*")).execution_options(yield_per = SCORING_BATCH_SIZE)
+        )
+
+        # greatest to least relevance score, otherwise soonest to oldest
+        # dates (default to date if no search terms)
+        by_relevance = sort == "relevance" and bool(search_terms)
+
+        # only the jobs up to the end of the requested page are kept, in a
+        # min-heap of (sort key, -position, job, score) so the weakest is
+        # evicted first and ties keep their original order
+        offset = (page - 1) * page_size
+        top = []
+        total = 0
 
         # score and filter jobs
-        scored_jobs = []
-        for job in jobs:
+        position = -1
+        async for job in result.scalars():
+            position += 1
             # calculate relevance score
             score = self._calculate_relevance(
-                job, search_terms, exclusion_terms
+                job, term_weights, excluded, now_ts
             )
 
             # exclude if contains exclusion terms of no match
             if score is None:
                 continue
+            total += 1
 
-            scored_jobs.append((job, score))
-        
-        total = len(scored_jobs)
+            entry = (
+                score if by_relevance else _as_utc(job.date_posted),
+                -position, job, score
+            )
+            if len(top) < offset + page_size:
+                heapq.heappush(top, entry)
+            else:
+                heapq.heappushpop(top, entry)
+
+        # paginate
+        ranked = sorted(top, reverse = True)
+        paginated = [(job, score) for _, _, job, score in ranked[offset:]]
+
+        # second phase, sources and application for the page in one go
+        if paginated:
+            await self.session.execute(
+                select(Job)
+                .filter(Job.id.in_([job.id for job, _ in paginated]))
+                .options(*self._result_options())
+                .execution_options(populate_existing = True)
+            )
+
+        return paginated, total
+
+    async def _browse(self, stmt, page: int, page_size: int) -> tuple:
+        """
+        Queryless search, newest first.
+
+        The score is only the recency boost, which never ranks an older
+        job above a newer one, so ordering by date_posted (indexed) and
+        paginating in SQL gives the same page without scoring every job.
+        """
+        result = await self.session.execute(
+            stmt.options(*self._result_options())
+            .add_columns(func.count().over().label("total"))
+            .order_by(Job.date_posted.desc())
+            .offset((page - 1) * page_size)
+            .limit(page_size)
+        )
+        rows = result.all()
+        total = await self._page_total(stmt, rows, page)
+
+        now_ts = datetime.now(UTC).timestamp()
+        return [
+            (job, self._get_recency_boost(job.date_posted, now_ts))
+            for job, _ in rows
+        ], total
+
+    async def _search_postgres(
+            self,
+            stmt,
+            search_terms: Sequence[str],
+            exclusion_terms: Sequence[str],
+            sort: str,
+            page: int,
+            page_size: int
+    ) -> tuple:
+        """
+        Match, score, sort and paginate in the database.
+
+        Matching uses the GIN indexed jobs.search_vector, ts_rank_cd stands
+        in for the Python TF score and the recency boost is added in SQL, so
+        only the requested page of jobs is loaded. The total comes back with
+        the page as a window count.
+        """
+        now = datetime.now(UTC)
+        days_ago = func.floor(
+            func.extract("epoch", now - Job.date_posted) / 86400
+        )
+        recency_boost = case(
+            (days_ago <= 7, 0.5 * (1 - days_ago / 7)),
+            else_ = 0.0
+        )
 
-        # sort results
+        if search_terms:
+            terms = " | ".join(search_terms)
+            tsquery = f"({terms})" + "".join(f" & !{term}" for term in exclusion_terms)
+            query = func.to_tsquery(SEARCH_CONFIG, tsquery)
+
+            # a query of stop words only ("the and") parses to an empty
+            # tsquery, which matches nothing. The Python path still finds
+            # those words, so treat it like a query without terms instead
+            stmt = stmt.filter(or_(
+                func.numnode(query) == 0,
+                Job.search_vector.op("@@")(query)
+            ))
+            score = (
+                func.ts_rank_cd(RANK_WEIGHTS, Job.search_vector, query)
+                / len(search_terms)
+                + recency_boost
+            )
+        else:
+            if exclusion_terms:
+                excluded = func.to_tsquery(SEARCH_CONFIG, " | ".join(exclusion_terms))
+                stmt = stmt.filter(~Job.search_vector.op("@@")(excluded))
+            score = recency_boost
+
+        score = score.label("score")
         if sort == "relevance" and search_terms:
-            # greatest to least relevance score sort
-            scored_jobs.sort(key = lambda x: x[1], reverse = True)
+            order_by = (score.desc(), Job.date_posted.desc())
         else:
-            # sort from soonest to oldest dates
-            # default to date if no search terms
-            scored_jobs.sort(key = lambda x: x[0].date_posted, reverse = True)
+            order_by = (Job.date_posted.desc(),)
 
-        # paginate
-        offset = (page - 1) * page_size
-        paginated = scored_jobs[offset:offset + page_size]
+        page_stmt = (
+            stmt.options(*self._result_options())
+            .add_columns(score, func.count().over().label("total"))
+            .order_by(*order_by)
+            .offset((page - 1) * page_size)
+            .limit(page_size)
+        )
+        rows = (await self.session.execute(page_stmt)).all()
+        total = await self._page_total(stmt, rows, page)
 
-        return paginated, total
-            
+        return [(job, score) for job, score, _ in rows], total
+
+    async def _page_total(self, stmt, rows: Sequence, page: int) -> int:
+        """
+        Total matches for a page fetched with a count(*) OVER () column.
+
+        The window count comes back on every row of the page, only a page
+        past the end (no rows at all) needs a separate count query.
+        """
+        if rows:
+            return rows[0].total
+        if page == 1:
+            return 0
+
+        count_stmt = select(func.count()).select_from(
+            stmt.with_only_columns(Job.id).subquery()
+        )
+        return (await self.session.execute(count_stmt)).scalar_one()
         
+    def _result_options(self) -> tuple:
+        """Loader options for jobs handed back to the API."""
+        return (
+            selectinload(Job.sources),
+            selectinload(Job.application),
+            raiseload("*")
+        )
+
+    async def _get_idf(self, search_terms: Sequence[str]) -> Dict[str, float]:
+        """
+        BM25 inverse document frequency of each search term,
+        log((N - df + 0.5) / (df + 0.5) + 1).
+        """
+        total_jobs = (
+            await self.session.execute(select(func.count()).select_from(Job))
+        ).scalar_one()
+        result = await self.session.execute(
+            select(TermDocumentFrequency.term, TermDocumentFrequency.df)
+            .filter(TermDocumentFrequency.term.in_(set(search_terms)))
+        )
+        df = dict(result.all())
+
+        idf = {}
+        for term in search_terms:
+            term_df = min(df.get(term, 0), total_jobs)
+            idf[term] = math.log((total_jobs - term_df + 0.5) / (term_df + 0.5) + 1)
+
+        return idf
+
+    def _term_weights(
+            self,
+            search_terms: Sequence[str],
+            idf: Dict[str, float]
+    ) -> List[Tuple[str, float, float]]:
+        """
+        Per term (term, title weight, description weight) for a query.
+
+        IDF, the field weights (title 1.0, description 3.0) and the
+        query length normalization are folded together once per request,
+        leaving one multiply per matched field in the per-job loop.
+        """
+        norm = len(search_terms)
+        return [
+            (term, idf.get(term, 1.0) * 1.0 / norm, idf.get(term, 1.0) * 3.0 / norm)
+            for term in search_terms
+        ]
+
     def _calculate_relevance(
             self,
             job: Job,
-            search_terms: List[str],
-            exclusion_terms: List[str]
+            term_weights: List[Tuple[str, float, float]],
+            exclusion_terms: Set[str],
+            now_ts: float
     ) -> Optional[float]:
         """
         Calculate relevance score for a job.
 
         Returns None if job should be excluded.
         """
-        # if no search terms, return date-based score
-        if not search_terms:
-            return self._get_recency_boost(job.date_posted)
+        # if no search or exclusion terms, return date-based score
+        if not term_weights and not exclusion_terms:
+            return self._get_recency_boost(job.date_posted, now_ts)
         
-        # check exclusion terms first (hard filter)
-        if exclusion_terms:
-            job_text = f"{job.original_title} {job.description}".lower()
-            
-            for term in exclusion_terms:
-                if term in job_text:
-                    return None # exclude this job
-        
-        # tokenize job fields
-        title_tokens = tokenize_for_search(job.original_title)
-        desc_tokens = tokenize_for_search(job.description)
+        # token counts are stored at ingest, older rows are tokenized here
+        title_terms = job.title_terms or term_frequencies(job.original_title)
+        desc_terms = job.description_terms or term_frequencies(
+            job.description[:settings.description_terms_max_chars]
+        )
 
-        title_score = 0.0
-        desc_score = 0.0
+        # check exclusion terms first (hard filter), as token lookups
+        # instead of substring scans over the whole text. The stored
+        # description terms stop at description_terms_max_chars, which only
+        # bounds scoring, so longer descriptions are tokenized in full here
+        if exclusion_terms and not (
+            title_terms.keys().isdisjoint(exclusion_terms)
+            and desc_terms.keys().isdisjoint(exclusion_terms)
+            and (
+                len(job.description) <= settings.description_terms_max_chars
+                or term_frequencies(job.description).keys().isdisjoint(exclusion_terms)
+            )
+        ):
+            return None # exclude this job
 
-        # calculate TF for each search term
-        for term in search_terms:
+        # exclusions only (e.g. "-senior"), everything else is date-based
+        if not term_weights:
+            return self._get_recency_boost(job.date_posted, now_ts)
+
+        relevance = 0.0
+
+        # calculate TF-IDF for each search term, already normalized by
+        # query length
+        for term, title_weight, desc_weight in term_weights:
             # title matches (weight = 1.0)
-            title_tf = title_tokens.count(term)
-            if title_tf > 0:
+            title_tf = title_terms.get(term)
+            if title_tf:
                 # diminishing returns for multiple occurences
-                title_score += 1.0 * math.log(1 + title_tf)
+                relevance += title_weight * math.log1p(title_tf)
             
             # description matches (weight = 3.0)
-            desc_tf = desc_tokens.count(term)
-            if desc_tf > 0:
-                desc_score += 3.0 * math.log(1 + desc_tf)
-        
-        # combined score
-        relevance = title_score + desc_score
+            desc_tf = desc_terms.get(term)
+            if desc_tf:
+                relevance += desc_weight * math.log1p(desc_tf)
 
         # no matches at all
         if relevance == 0:
             return None
-        
-        # normalize by query length
-        relevance = relevance / len(search_terms)
 
         # add recency boost
-        recency_boost = self._get_recency_boost(job.date_posted)
+        recency_boost = self._get_recency_boost(job.date_posted, now_ts)
         relevance += recency_boost
 
         return relevance
 
-    def _get_recency_boost(self, date_posted: datetime) -> float:
+    def _get_recency_boost(self, date_posted: datetime, now_ts: float) -> float:
         """
         Small boost for recent postings.
         Jobs in last 7 days get up to 0.5 boost.
+
+        now_ts is the request's timestamp, taken once by the caller.
         """
-        if date_posted.tzinfo is None:
-            date_posted = date_posted.replace(tzinfo=UTC)
-        days_ago = (datetime.now(UTC) - date_posted).days
+        days_ago = (now_ts - _as_utc(date_posted).timestamp()) // 86400
 
         if days_ago <= 7:
             return 0.5 * (1 - days_ago / 7)
@@ -1,8 +1,65 @@
 
 import re
-from Levenshtein import ratio
-from typing import Tuple
+from collections import Counter
+from functools import lru_cache
+from hashlib import blake2b
+from rapidfuzz import fuzz
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
 
+# duplicate thresholds for normalized titles and description shingles
+TITLE_SIMILARITY_THRESHOLD = 0.75
+# Jaccard over 5 character shingles scores far lower than an edit distance
+# ratio on the same text, reworded reposts land around 0.5-0.6 while
+# different roles at the same company stay below 0.33
+DESCRIPTION_SIMILARITY_THRESHOLD = 0.4
+
+# patterns are compiled once at import instead of on every call
+
+# common company suffixes, stripped from the end of the name in one pass
+# (stacked suffixes like "co inc" are all removed, a comma works as the
+# separator too, "stripe,inc.")
+_COMPANY_SUFFIX_RE = re.compile(
+    r'(?:[\s,]+(?:inc\.?|incorporated|llc\.?|ltd\.?|corporation|corp\.?'
+    r'|company|co\.?|limited))+$',
+    re.IGNORECASE
+)
+
+# common job title abbreviations and variations, as
+# group name -> (pattern, replacement)
+_TITLE_REPLACEMENTS = {
+    'swe': (r'\bswe\b', 'software engineer'),
+    'sr': (r'\bsr\.?\b', 'senior'),
+    'jr': (r'\bjr\.?\b', 'junior'),
+    'mgr': (r'\bmgr\.?\b', 'manager'),
+    'dev': (r'\bdev\.?\b', 'developer'),
+    'eng': (r'\beng\.?\b', 'engineer'),
+    'qa': (r'\bqa\b', 'quality assurance'),
+    'ml': (r'\bml\b', 'machine learning'),
+    'ai': (r'\bai\b', 'artificial intelligence'),
+    'fe': (r'\bfe\b', 'frontend'),
+    'be': (r'\bbe\b', 'backend'),
+    'fs': (r'\bfs\b', 'fullstack'),
+    'ui_ux': (r'\bui/ux\b', 'ui ux'),
+}
+
+# all abbreviations in a single alternation, the matched group name
+# picks the replacement
+_TITLE_ABBREVIATION_RE = re.compile('|'.join(
+    f'(?P<{name}>{pattern})' for name, (pattern, _) in _TITLE_REPLACEMENTS.items()
+))
+
+def _expand_abbreviation(match: re.Match) -> str:
+    # replacement for whichever named group of _TITLE_ABBREVIATION_RE matched
+    return _TITLE_REPLACEMENTS[match.lastgroup][1]
+
+_NON_WORD_RE = re.compile(r'[^\w\s]')
+_NON_TITLE_RE = re.compile(r'[^\w\s/]')
+_WHITESPACE_RE = re.compile(r'\s+')
+# a minus only excludes at the start of a word, "full-stack" stays a search term
+_EXCLUSION_RE = re.compile(r'(?<!\S)-(\w+)')
+_TOKEN_RE = re.compile(r'\d+(?:\.\d+)?|\w+')
+
+@lru_cache(maxsize = 65536)
 def normalize_company(company: str) -> str:
     """
     Normalize common company names for deduplication
@@ -22,26 +79,17 @@ def normalize_company(company: str) -> str:
     normalized = company.lower().strip()
 
     # remove common suffixes
-    suffixes = [
-        r'\s+inc\.?$', r'\s+incorporated$',
-        r'\s+llc\.?$', r'\s+ltd\.?$',
-        r'\s+corporation$', r'\s+corp\.?$',
-        r'\s+company$', r'\s+co\.?$',
-        r'\s+limited$'
-    ]
-
-    # finds all instances of suffix in normalized and replaces it with ''
-    for suffix in suffixes:
-        normalized = re.sub(suffix, '', normalized, flags = re.IGNORECASE)
+    normalized = _COMPANY_SUFFIX_RE.sub('', normalized)
 
     # remove special characters except spaces
-    normalized = re.sub(r'[^\w\s]', '', normalized)
+    normalized = _NON_WORD_RE.sub('', normalized)
 
     # collapse multiple spaces
-    normalized = re.sub(r'\s+', ' ', normalized).strip()
+    normalized = _WHITESPACE_RE.sub(' ', normalized).strip()
 
     return normalized
 
+@lru_cache(maxsize = 65536)
 def normalize_title(title: str) -> str:
     """
     Normalize common job titles for deduplication
@@ -59,43 +107,41 @@ def normalize_title(title: str) -> str:
     normalized = title.lower().strip()
 
     # common abbreviations and variations
-    replacements = {
-        r'\bswe\b': 'software engineer',
-        r'\bsr\.?\b': 'senior',
-        r'\bjr\.?\b': 'junior',
-        r'\bmgr\.?\b': 'manager',
-        r'\bdev\.?\b': 'developer',
-        r'\beng\.?\b': 'engineer',
-        r'\bqa\b': 'quality assurance',
-        r'\bml\b': 'machine learning',
-        r'\bai\b': 'artificial intelligence',
-        r'\bfe\b': 'frontend',
-        r'\bbe\b': 'backend',
-        r'\bfs\b': 'fullstack',
-        r'\bui/ux\b': 'ui ux',
-    }
-
-    for pattern, replacement in replacements.items():
-        normalized = re.sub(pattern, replacement, normalized)
+    normalized = _TITLE_ABBREVIATION_RE.sub(_expand_abbreviation, normalized)
 
     # remove special characters except spaces and slashes
-    normalized = re.sub(r'[^\w\s/]', '', normalized)
+    normalized = _NON_TITLE_RE.sub('', normalized)
 
     # collapse multiple spaces
-    normalized = re.sub(r'\s+', ' ', normalized).strip()
+    normalized = _WHITESPACE_RE.sub(' ', normalized).strip()
 
     return normalized
 
-def calculate_text_similarity(text1: str, text2: str) -> float:
+def calculate_text_similarity(
+        text1: str,
+        text2: str,
+        min_threshold: float = 0.0
+) -> float:
     """
-    Calculate similarity between two text strings using Levenshtein ratio.
+    Calculate similarity between two text strings using the normalized
+    Indel (Levenshtein without substitutions) ratio from rapidfuzz.
+
+    The ratio can never exceed 2 * shorter / (shorter + longer), so when
+    that bound is already below min_threshold the edit distance is not
+    run at all. Otherwise min_threshold is passed on as rapidfuzz's
+    score_cutoff, which gives up as soon as the distance budget is spent.
+    Either way a pair below min_threshold scores 0.0, only callers that
+    just need the yes/no answer should pass it.
     
     :param text1: first string
     :type text1: str
     :param text2: second string
     :type text2: str
+    :param min_threshold: similarity the caller needs, pairs that can't
+                          reach it are cut short
+    :type min_threshold: float
     :return: score between 0 and 1 indicating how similar the two texts 
-             are
+             are, pairs below min_threshold score 0.0
     :rtype: float
     """
     if not text1 or not text2:
@@ -105,7 +151,118 @@ def calculate_text_similarity(text1: str, text2: str) -> float:
     t1 = text1.lower().strip()
     t2 = text2.lower().strip()
 
-    return ratio(t1, t2)
+    shorter, longer = sorted((len(t1), len(t2)))
+    if not longer:
+        return fuzz.ratio(t1, t2) / 100
+    upper_bound = 2 * shorter / (shorter + longer)
+    if upper_bound < min_threshold:
+        return 0.0
+
+    return fuzz.ratio(t1, t2, score_cutoff = min_threshold * 100) / 100
+
+def description_shingles(text: str, size: int = 5) -> frozenset:
+    """
+    Break text into the set of its overlapping character shingles.
+
+    Shingles are stored as hashes to keep the sets small. Not cached, a
+    description is compared against a handful of candidates at most, so
+    ingest shingles each incoming job once in preprocess_job instead.
+
+    :param text: text to shingle, already lowercased and trimmed
+    :type text: str
+    :param size: number of characters per shingle
+    :type size: int
+    :return: set of shingle hashes
+    :rtype: frozenset
+    """
+    if len(text) < size:
+        return frozenset((hash(text),)) if text else frozenset()
+
+    return frozenset(hash(text[i:i + size]) for i in range(len(text) - size + 1))
+
+def shingle_similarity(shingles1: frozenset, shingles2: frozenset) -> float:
+    """
+    Jaccard similarity of two shingle sets, |A & B| / |A | B|.
+
+    Unlike edit distance this is linear in the text length and does not
+    penalise reordered sentences.
+
+    :param shingles1: first set of shingles
+    :type shingles1: frozenset
+    :param shingles2: second set of shingles
+    :type shingles2: frozenset
+    :return: score between 0 and 1
+    :rtype: float
+    """
+    if not shingles1 or not shingles2:
+        return 0.0
+
+    intersection = len(shingles1 & shingles2)
+    return intersection / (len(shingles1) + len(shingles2) - intersection)
+
+def description_fingerprint(description: str) -> Optional[int]:
+    """
+    64-bit SimHash of a job description, stored on the job at ingest.
+
+    Descriptions that differ by a few words end up with fingerprints that
+    differ in only a few bits. Token hashes use blake2b rather than the
+    builtin hash so the value is stable across processes and can be
+    persisted.
+
+    :param description: job description
+    :type description: str
+    :return: fingerprint as a signed 64-bit integer (fits a BIGINT column),
+             None when the description has no tokens
+    :rtype: Optional[int]
+    """
+    tokens = _tokenize(description[:1000])
+    return _simhash(tokens) if tokens else None
+
+@lru_cache(maxsize = 65536)
+def _token_hash(token: str) -> int:
+    return int.from_bytes(blake2b(token.encode(), digest_size = 8).digest(), "big")
+
+def _simhash(tokens: Sequence[str]) -> int:
+    # per bit position count of set bits across the token hashes, kept
+    # bit-sliced: bit i of counters[j] is bit j of the count for position
+    # i, so adding a token updates all 64 counts with a few int operations
+    counters = []
+    total = 0
+    for token in tokens:
+        carry = _token_hash(token)
+        total += 1
+        for j, counter in enumerate(counters):
+            counters[j] = counter ^ carry
+            carry &= counter
+            if not carry:
+                break
+        if carry:
+            counters.append(carry)
+
+    # a bit is set when it is set in more than half of the token hashes
+    fingerprint = 0
+    for bit in range(64):
+        ones = 0
+        for j, counter in enumerate(counters):
+            ones |= (counter >> bit & 1) << j
+        if 2 * ones > total:
+            fingerprint |= 1 << bit
+
+    # shift into the signed range
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+def fingerprint_distance(fingerprint1: int, fingerprint2: int) -> int:
+    """
+    Number of differing bits (hamming distance) between two fingerprints.
+
+    :param fingerprint1: first description fingerprint
+    :type fingerprint1: int
+    :param fingerprint2: second description fingerprint
+    :type fingerprint2: int
+    :return: hamming distance between 0 and 64
+    :rtype: int
+    """
+    return ((fingerprint1 ^ fingerprint2) & 0xFFFFFFFFFFFFFFFF).bit_count()
 
 def is_duplicate_job(
         company1: str, title1: str, desc1: str,
@@ -116,8 +273,8 @@ def is_duplicate_job(
     
     Heuristic:
     - Company must match (normalized)
-    - Title similarity >= 0.8 OR
-    - Description similarity >= 0.7 (for shorter descriptions)
+    - Title similarity >= 0.75 AND
+    - Description shingle similarity >= 0.4 (first 1000 characters)
     
     :param company1: first company's name
     :type company1: str
@@ -136,81 +293,177 @@ def is_duplicate_job(
              value is the similarity score used to make that decision.
     :rtype: Tuple[bool, float]
     """
-    # company must match
-    norm_company1 = normalize_company(company1)
-    norm_company2 = normalize_company(company2)
+    # company must match, checked before any similarity is computed
+    if normalize_company(company1) != normalize_company(company2):
+        return False, 0.0
 
     norm_title1 = normalize_title(title1)
     norm_title2 = normalize_title(title2)
-    title_similarity = calculate_text_similarity(norm_title1, norm_title2)
 
-    if norm_company1 != norm_company2:
-        return False, 0.0
+    # identical repost (same title and compared description), plain string
+    # equality is cheaper than hashing both sides for a single pair. Empty
+    # titles or descriptions never match, same as the similarity path below
+    head1 = desc1[:1000].lower().strip()
+    if (
+        norm_title1
+        and head1
+        and norm_title1 == norm_title2
+        and head1 == desc2[:1000].lower().strip()
+    ):
+        return True, 1.0
+
+    # no min_threshold, the returned score is the real title similarity
+    # even when it rules the pair out
+    title_similarity = calculate_text_similarity(norm_title1, norm_title2)
     
-    if title_similarity < 0.75:
+    if title_similarity < TITLE_SIMILARITY_THRESHOLD:
         return False, title_similarity
     
+    return is_duplicate_description(desc1, desc2)
+
+def is_duplicate_description(
+        desc1: str,
+        desc2: str,
+        shingles1: Optional[frozenset] = None
+) -> Tuple[bool, float]:
+    """
+    Decide whether two descriptions belong to the same posting.
+
+    :param desc1: first job's description
+    :type desc1: str
+    :param desc2: second job's description
+    :type desc2: str
+    :param shingles1: shingles of desc1 when the caller already has them
+                      (PreprocessedJob.description_shingles)
+    :type shingles1: Optional[frozenset]
+    :return: whether the descriptions match, and their similarity
+    :rtype: Tuple[bool, float]
+    """
     # desc scores based on first 1000 characters
     # idea: job title in practice is almost always the same across different websites
     # and many companies list different jobs under the same title if they are filling
     # more than one position. Thus, description must be the main factor in ruling
     # duplicate jobs
-    desc_sample1 = desc1[:1000].lower()
-    desc_sample2 = desc2[:1000].lower()
-    desc_similarity = calculate_text_similarity(desc_sample1, desc_sample2)
+    if shingles1 is None:
+        shingles1 = description_shingles(desc1[:1000].lower().strip())
+    shingles2 = description_shingles(desc2[:1000].lower().strip())
+
+    # jaccard similarity can never exceed smaller / larger set size,
+    # so descriptions of very different length are rejected without
+    # intersecting the sets at all
+    larger = max(len(shingles1), len(shingles2))
+    if larger and min(len(shingles1), len(shingles2)) / larger < DESCRIPTION_SIMILARITY_THRESHOLD:
+        return False, 0.0
+
+    desc_similarity = shingle_similarity(shingles1, shingles2)
 
-    if desc_similarity >= 0.7:
+    if desc_similarity >= DESCRIPTION_SIMILARITY_THRESHOLD:
         return True, desc_similarity
     
     return False, desc_similarity
 
-def extract_exclusion_terms(query: str) -> Tuple[str, list]:
+class PreprocessedJob(NamedTuple):
+    normalized_company: str
+    normalized_title: str
+    # first 1000 characters, lowercased and trimmed, as compared by is_duplicate_job
+    description_head: str
+    # None when the description has no tokens, there is nothing to compare
+    fingerprint: Optional[int]
+    # shingles of description_head, computed once per incoming job
+    description_shingles: frozenset
+
+def preprocess_job(company: str, title: str, description: str) -> PreprocessedJob:
+    """
+    Compute everything deduplication needs from an incoming job once.
+
+    The description is sliced and lowercased a single time and both the
+    fingerprint and the shingle comparison work from that copy.
+
+    :param company: given name of company
+    :type company: str
+    :param title: given job title
+    :type title: str
+    :param description: job description
+    :type description: str
+    :return: normalized company and title, description head, fingerprint
+        (None for a description without tokens) and description shingles
+    :rtype: PreprocessedJob
+    """
+    description_head = description[:1000].lower().strip()
+
+    return PreprocessedJob(
+        normalize_company(company),
+        normalize_title(title),
+        description_head,
+        description_fingerprint(description_head),
+        description_shingles(description_head)
+    )
+
+@lru_cache(maxsize = 10000)
+def extract_exclusion_terms(query: str) -> Tuple[str, Tuple[str, ...]]:
     """
     Given a search query, will extract terms to be excluded from
     search results.
 
+    Results are cached so paging through the same query skips the
+    parse, hence the tuple of terms.
+
     Example:
-    - "python -senior -staff" -> ("python", ["senior", "staff"])
-    - "react -remote" -> ("react", ["remote"])
+    - "python -senior -staff" -> ("python", ("senior", "staff"))
+    - "react -remote" -> ("react", ("remote",))
     
     :param query: search query
     :type query: str
-    :return: query with extracted terms removed, and a list of those excluded terms
-    :rtype: Tuple[str, list]
+    :return: query with extracted terms removed, and a tuple of those excluded terms
+    :rtype: Tuple[str, Tuple[str, ...]]
     """
     exclusion_terms = []
 
-    # find all terms starting with minus
-    exclusion_pattern = r'-(\w+)'
-    matches = re.finditer(exclusion_pattern, query)
-
-    for match in matches:
+    def _collect(match: re.Match) -> str:
         exclusion_terms.append(match.group(1).lower())
+        return ''
 
-    # remove exclusion terms from query
-    cleaned_query = re.sub(exclusion_pattern, '', query).strip()
+    # collect terms starting with minus and remove them in the same scan
+    cleaned_query = _EXCLUSION_RE.sub(_collect, query).strip()
     
     # collapse whitespaces
-    cleaned_query = re.sub(r'\s+', ' ', cleaned_query)
+    cleaned_query = _WHITESPACE_RE.sub(' ', cleaned_query)
 
-    return cleaned_query, exclusion_terms
+    return cleaned_query, tuple(exclusion_terms)
 
-def tokenize_for_search(text: str) -> list:
+@lru_cache(maxsize = 8192)
+def tokenize_for_search(text: str) -> Tuple[str, ...]:
     """
     tokenization of text for search.
     Converts text to lowercase tokens, removing special characters.
+
+    Results are cached, repeated queries (e.g. paging through results)
+    skip the regex entirely. Tokens are returned as a tuple so the cached
+    value can't be mutated by a caller.
     
     :param text: given text for a search
     :type text: str
-    :return: list of corresponding tokens
-    :rtype: list
+    :return: tuple of corresponding tokens
+    :rtype: Tuple[str, ...]
     """
-    text = text.lower()
+    return tuple(_tokenize(text))
 
-    # keep only alphanumeric and spaces
-    # text = re.sub(r'[^\w\s]', ' ', text)
+def _tokenize(text: str) -> list:
+    # uncached, for one-off job descriptions that would only evict queries
+    # one findall over the lowercased text, numbers like "3.9" stay whole
+    # and any other non word character splits tokens
+    return _TOKEN_RE.findall(text.lower())
 
-    # # split and filter empty
-    # tokens = [t for t in text.split() if t]
-    tokens = re.findall(r'\d+(?:\.\d+)?|\w+', text)
-    return tokens
\ No newline at end of file
+def term_frequencies(text: str) -> Dict[str, int]:
+    """
+    Count how often each search token occurs in the text.
+
+    Stored on the job at ingest so relevance scoring is a dict lookup
+    per search term instead of re-tokenizing the job on every request.
+
+    :param text: given text of a job field
+    :type text: str
+    :return: mapping of token to number of occurrences
+    :rtype: Dict[str, int]
+    """
+    return dict(Counter(_tokenize(text)))
@@ -1,40 +1,64 @@
 import os
-import asyncio
 import pytest
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
 
 # 🔑 IMPORTANT: set env vars BEFORE importing app code
-os.environ["database_url"] = "sqlite:///./test.db"
+os.environ["database_url"] = "sqlite:///:memory:"
 os.environ["database_url_async"] = "sqlite+aiosqlite:///:memory:"
 
 from app.models import Base  # noqa: E402
 
 
+# in-memory databases are private to the process, so pytest-xdist workers
+# (pytest -n N) never share state
 TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
 
 @pytest.fixture(scope="session")
-def event_loop():
-    loop = asyncio.new_event_loop()
-    yield loop
-    loop.close()
+async def engine():
+    # one in-memory database for the whole run, the schema is created once
+    engine = create_async_engine(TEST_DATABASE_URL, echo=False)
 
+    # let SQLAlchemy emit BEGIN itself, the sqlite driver's own transaction
+    # handling breaks SAVEPOINTs
+    @event.listens_for(engine.sync_engine, "connect")
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
 
-@pytest.fixture
-async def async_session():
-    engine = create_async_engine(TEST_DATABASE_URL, echo=False)
+    @event.listens_for(engine.sync_engine, "begin")
+    def do_begin(conn):
+        conn.exec_driver_sql("BEGIN")
 
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
-    AsyncSessionLocal = sessionmaker(
-        engine,
-        class_=AsyncSession,
-        expire_on_commit=False
-    )
+    yield engine
+
+    await engine.dispose()
+
 
-    async with AsyncSessionLocal() as session:
+@pytest.fixture
+async def db_connection(engine):
+    # each test runs inside a transaction that is rolled back afterwards,
+    # test classes can override this with a wider scoped, pre-seeded connection
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        yield conn
+        await transaction.rollback()
+
+
+@pytest.fixture
+async def async_session(db_connection):
+    # the test's own changes are undone by rolling back to this SAVEPOINT,
+    # commits made by the code under test only release a nested one
+    savepoint = await db_connection.begin_nested()
+
+    async with AsyncSession(
+        bind=db_connection,
+        expire_on_commit=False,
+        join_transaction_mode="create_savepoint"
+    ) as session:
         yield session
 
-    await engine.dispose()
+    await savepoint.rollback()
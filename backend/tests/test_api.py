@@ -1,32 +1,52 @@
 import pytest
-from httpx import AsyncClient, ASGITransport
+import json
+from httpx import AsyncClient, ASGITransport, URL
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta, UTC
 import uuid
 
 from app.main import app
 from app.database import get_db
+from app.crud import JobCRUD
+from app.schemas import JobSourceInput
+from app.models import JobSource
+
+@pytest.fixture(scope="session")
+def _transport():
+    return ASGITransport(app=app)
+
+@pytest.fixture(scope="session")
+async def _client(_transport):
+    # one client for the whole run, tests only swap the database override
+    async with AsyncClient(
+        transport=_transport,
+        base_url="http://test",
+        # in memory ASGI calls, don't pick up proxy/cert settings from the environment
+        trust_env=False,
+    ) as c:
+        yield c
 
 @pytest.fixture
-async def client(async_session):
+async def client(_client, async_session):
     async def override_get_db():
         yield async_session
 
     app.dependency_overrides[get_db] = override_get_db
 
-    transport = ASGITransport(app=app)
-
-    async with AsyncClient(
-        transport=transport,
-        base_url="http://test",
-    ) as c:
-        yield c
+    yield _client
 
-    app.dependency_overrides.clear()
+    app.dependency_overrides.pop(get_db, None)
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_jobs():
-    """Sample job data for testing."""
-    return [
+    """
+    Sample job data for testing, built once per run.
+
+    A tuple so tests can't add or drop jobs for later tests, copy a job
+    with dict(job) before changing it.
+    """
+    return (
         {
             "id": "1",
             "source": "linkedin",
@@ -57,7 +77,24 @@ def sample_jobs():
             "url": "https://stripe.com/jobs/003",
             "date_posted": "2025-01-02T09:00:00Z"
         }
-    ]
+    )
+
+# ingest bodies are encoded once per run and posted with content=
+JSON_HEADERS = {"content-type": "application/json"}
+
+# paths hit several times per test, parsed once
+SEARCH_URL = URL("/jobs/search")
+APPLICATIONS_URL = URL("/applications")
+
+@pytest.fixture(scope="session")
+def manual_ingest_body(sample_jobs):
+    """All sample jobs as an encoded manual /jobs/ingest body."""
+    return json.dumps({"source": "manual", "jobs": sample_jobs}).encode()
+
+@pytest.fixture(scope="session")
+def first_job_ingest_body(sample_jobs):
+    """The first sample job alone as an encoded manual /jobs/ingest body."""
+    return json.dumps({"source": "manual", "jobs": [sample_jobs[0]]}).encode()
 
 ###############################################################################################################
 class TestRootEndpoints:
@@ -83,13 +120,10 @@ class TestJobIngestion:
     """Test job ingestion endpoints."""
     
     @pytest.mark.asyncio
-    async def test_ingest_single_job(self, client, sample_jobs):
-        payload = {
-            "source": "manual",
-            "jobs": [sample_jobs[0]]
-        }
-        
-        response = await client.post("/jobs/ingest", json=payload)
+    async def test_ingest_single_job(self, client, first_job_ingest_body):
+        response = await client.post(
+            "/jobs/ingest", content=first_job_ingest_body, headers=JSON_HEADERS
+        )
         assert response.status_code == 200
         
         data = response.json()
@@ -98,13 +132,10 @@ class TestJobIngestion:
         assert data["total_processed"] == 1
     
     @pytest.mark.asyncio
-    async def test_ingest_multiple_jobs(self, client, sample_jobs):
-        payload = {
-            "source": "manual",
-            "jobs": sample_jobs
-        }
-        
-        response = await client.post("/jobs/ingest", json=payload)
+    async def test_ingest_multiple_jobs(self, client, manual_ingest_body):
+        response = await client.post(
+            "/jobs/ingest", content=manual_ingest_body, headers=JSON_HEADERS
+        )
         assert response.status_code == 200
         
         data = response.json()
@@ -113,201 +144,138 @@ class TestJobIngestion:
         assert data["total_processed"] == 3
     
     @pytest.mark.asyncio
-    async def test_ingest_duplicate_same_source(self, client, sample_jobs):
-        payload = {
-            "source": "linkedin",
-            "jobs": [sample_jobs[0]]
-        }
-        
-        # First ingestion
-        response1 = await client.post("/jobs/ingest", json=payload)
-        assert response1.status_code == 200
-        assert response1.json()["inserted"] == 1
-        
-        # Second ingestion - same source, same ID
-        response2 = await client.post("/jobs/ingest", json=payload)
-        assert response2.status_code == 200
-        data = response2.json()
-        assert data["inserted"] == 0  # Should not insert again
-        assert data["merged"] == 0    # Should not merge (same source)
-    
-    @pytest.mark.asyncio
-    async def test_ingest_duplicate_different_source(self, client):
-        # First ingestion from LinkedIn
-        payload1 = {
-            "source": "linkedin",
-            "jobs": [{
-                "id": "google-001",
-                "source": "linkedin",
-                "company": "Google LLC",
-                "title": "Software Engineer",
-                "description": "Build systems",
-                "location": "Mountain View, CA",
-                "url": "https://linkedin.com/jobs/google-001",
-                "date_posted": "2025-01-01T10:00:00Z"
-            }]
-        }
-        
-        response1 = await client.post("/jobs/ingest", json=payload1)
-        assert response1.status_code == 200
-        assert response1.json()["inserted"] == 1
-        
-        # Second ingestion from Indeed - same job, different source
-        payload2 = {
-            "source": "indeed",
-            "jobs": [{
-                "id": "google-002",
-                "source": "indeed",
-                "company": "Google Inc",  # Different name variant
-                "title": "SWE",            # Different title variant
-                "description": "Build systems",
-                "location": "Mountain View, CA",
-                "url": "https://indeed.com/jobs/google-002",
-                "date_posted": "2025-01-01T10:00:00Z"
-            }]
-        }
-        
-        response2 = await client.post("/jobs/ingest", json=payload2)
-        assert response2.status_code == 200
-        data = response2.json()
-        assert data["inserted"] == 0  # Should not insert new job
-        assert data["merged"] == 1    # Should merge into existing job
-    
-    @pytest.mark.asyncio
-    async def test_ingest_invalid_payload(self, client):
-        # Missing required fields
-        payload = {
-            "source": "manual",
-            "jobs": [{
-                "id": "bad-job",
-                "company": "Test"
-                # Missing title, description, etc.
-            }]
-        }
-        
-        response = await client.post("/jobs/ingest", json=payload)
+    @pytest.mark.parametrize("build_payload", [
+        # missing title, description, etc.
+        lambda jobs: {"source": "manual", "jobs": [{"id": "bad-job", "company": "Test"}]},
+        # source not in allowed list
+        lambda jobs: {"source": "invalid_source", "jobs": [jobs[0]]},
+    ], ids=["missing_fields", "invalid_source"])
+    async def test_ingest_invalid_payload(self, client, sample_jobs, build_payload):
+        response = await client.post("/jobs/ingest", json=build_payload(sample_jobs))
         assert response.status_code == 422  # Validation error
     
     @pytest.mark.asyncio
-    async def test_ingest_invalid_source(self, client, sample_jobs):
-        payload = {
-            "source": "invalid_source",  # Not in allowed list
-            "jobs": [sample_jobs[0]]
-        }
-        
-        response = await client.post("/jobs/ingest", json=payload)
-        assert response.status_code == 422  # Validation error
+    async def test_ingest_malformed_json(self, client):
+        response = await client.post(
+            "/jobs/ingest",
+            content=b'{"source": "manual", "jobs": [',
+            headers={"content-type": "application/json"}
+        )
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["loc"][0] == "body"
 
 ###############################################################################################################
+def _dates_posted(data):
+    # fromisoformat reads the trailing "Z" itself since python 3.11
+    return list(map(datetime.fromisoformat, (job["date_posted"] for job in data["results"])))
+
+def check_all_jobs(data):
+    assert data["total"] == 3
+    assert len(data["results"]) == 3
+    assert data["page"] == 1
+    assert data["page_size"] == 20
+
+def check_query(data):
+    assert data["total"] >= 1  # At least one job mentions Python
+
+    # Verify results have relevance scores when searching
+    for job in data["results"]:
+        assert job["relevance_score"] is not None
+
+def check_exclusions(data):
+    # Should not include the "Senior Software Engineer" job
+    for job in data["results"]:
+        assert "senior" not in job["title"].lower()
+
+def check_company(data):
+    assert data["total"] == 1
+    assert "google" in data["results"][0]["company"].lower()
+
+def check_location(data):
+    assert data["total"] >= 1
+    for job in data["results"]:
+        assert "remote" in job["location"].lower()
+
+def check_days(data):
+    # Should only include recent jobs
+    cutoff = datetime.now(UTC) - timedelta(days=7)
+    for posted in _dates_posted(data):
+        assert posted >= cutoff
+
+def check_sorted_by_date(data):
+    # Verify sorted by date descending (newest first)
+    dates = _dates_posted(data)
+    assert dates == sorted(dates, reverse=True)
+
+def check_sorted_by_relevance(data):
+    # Verify sorted by relevance descending
+    scores = [job["relevance_score"] for job in data["results"] if job["relevance_score"]]
+    assert scores == sorted(scores, reverse=True)
+
+def check_empty(data):
+    assert data["total"] == 0
+    assert len(data["results"]) == 0
+
+@pytest.fixture(scope="class")
+async def seeded_connection(engine, sample_jobs):
+    """
+    Connection with the sample jobs ingested once for a whole test class.
+
+    Classes use it as their db_connection, each test rolls back to the
+    seeded state. The jobs go through the CRUD layer, not the HTTP API.
+    """
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        async with AsyncSession(
+            bind=conn,
+            join_transaction_mode="create_savepoint"
+        ) as session:
+            await JobCRUD(session).ingest_jobs(
+                "manual", [JobSourceInput(**job) for job in sample_jobs]
+            )
+        yield conn
+        await transaction.rollback()
+
+@pytest.fixture
+async def ingested_job_id(async_session, sample_jobs):
+    """Id of the first sample job, needs a class seeded by seeded_connection."""
+    job_id = (await async_session.execute(
+        select(JobSource.job_id).filter(JobSource.source_job_id == sample_jobs[0]["id"])
+    )).scalar_one()
+    return str(job_id)
+
 class TestJobSearch:
     """Test job search endpoints."""
+
+    @pytest.fixture(scope="class")
+    def db_connection(self, seeded_connection):
+        return seeded_connection
     
     @pytest.mark.asyncio
-    async def test_search_all_jobs(self, client, sample_jobs):
-        # First ingest some jobs
-        await client.post("/jobs/ingest", json={"source": "manual", "jobs": sample_jobs})
-        
-        # Search without filters
-        response = await client.get("/jobs/search")
-        assert response.status_code == 200
-        
-        data = response.json()
-        assert data["total"] == 3
-        assert len(data["results"]) == 3
-        assert data["page"] == 1
-        assert data["page_size"] == 20
-    
-    @pytest.mark.asyncio
-    async def test_search_with_query(self, client, sample_jobs):
-        await client.post("/jobs/ingest", json={"source": "manual", "jobs": sample_jobs})
-        
-        # Search for "python"
-        response = await client.get("/jobs/search?q=python")
-        assert response.status_code == 200
-        
-        data = response.json()
-        assert data["total"] >= 1  # At least one job mentions Python
-        
-        # Verify results have relevance scores when searching
-        for job in data["results"]:
-            assert job["relevance_score"] is not None
-    
-    @pytest.mark.asyncio
-    async def test_search_with_exclusions(self, client, sample_jobs):
-        await client.post("/jobs/ingest", json={"source": "manual", "jobs": sample_jobs})
-        
-        # Search for jobs but exclude "senior"
-        response = await client.get("/jobs/search?q=engineer%20-senior")
-        assert response.status_code == 200
-        
-        data = response.json()
-        # Should not include the "Senior Software Engineer" job
-        for job in data["results"]:
-            assert "senior" not in job["title"].lower()
-    
-    @pytest.mark.asyncio
-    async def test_search_by_company(self, client, sample_jobs):
-        await client.post("/jobs/ingest", json={"source": "manual", "jobs": sample_jobs})
-        
-        response = await client.get("/jobs/search?company=Google")
-        assert response.status_code == 200
-        
-        data = response.json()
-        assert data["total"] == 1
-        assert "google" in data["results"][0]["company"].lower()
-    
-    @pytest.mark.asyncio
-    async def test_search_by_location(self, client, sample_jobs):
-        await client.post("/jobs/ingest", json={"source": "manual", "jobs": sample_jobs})
-        
-        response = await client.get("/jobs/search?location=Remote")
-        assert response.status_code == 200
-        
-        data = response.json()
-        assert data["total"] >= 1
-        for job in data["results"]:
-            assert "remote" in job["location"].lower()
-    
-    @pytest.mark.asyncio
-    async def test_search_by_days(self, client, sample_jobs):
-        await client.post("/jobs/ingest", json={"source": "manual", "jobs": sample_jobs})
-        
-        # Search for jobs posted in last 7 days
-        response = await client.get("/jobs/search?days=7")
-        assert response.status_code == 200
-        
-        data = response.json()
-        # Should only include recent jobs
-        cutoff = datetime.now(UTC) - timedelta(days=7)
-        for job in data["results"]:
-            job_date = datetime.fromisoformat(job["date_posted"].replace("Z", "+00:00"))
-            assert job_date >= cutoff
-    
-    @pytest.mark.asyncio
-    async def test_search_sort_by_date(self, client, sample_jobs):
-        await client.post("/jobs/ingest", json={"source": "manual", "jobs": sample_jobs})
-        
-        response = await client.get("/jobs/search?sort=date")
-        assert response.status_code == 200
-        
-        data = response.json()
-        # Verify sorted by date descending (newest first)
-        dates = [datetime.fromisoformat(job["date_posted"].replace("Z", "+00:00")) 
-                 for job in data["results"]]
-        assert dates == sorted(dates, reverse=True)
-    
-    @pytest.mark.asyncio
-    async def test_search_sort_by_relevance(self, client, sample_jobs):
-        await client.post("/jobs/ingest", json={"source": "manual", "jobs": sample_jobs})
-        
-        response = await client.get("/jobs/search?q=python&sort=relevance")
+    @pytest.mark.parametrize("params,check", [
+        ("", check_all_jobs),
+        ("q=python", check_query),
+        ("q=engineer%20-senior", check_exclusions),
+        ("company=Google", check_company),
+        ("location=Remote", check_location),
+        ("days=7", check_days),
+        ("sort=date", check_sorted_by_date),
+        ("q=python&sort=relevance", check_sorted_by_relevance),
+        ("q=nonexistentquery12345", check_empty),
+    ], ids=[
+        "all_jobs", "query", "exclusions", "company", "location",
+        "days", "sort_by_date", "sort_by_relevance", "empty_results",
+    ])
+    async def test_search(self, client, params, check):
+        response = await client.get(f"/jobs/search?{params}")
         assert response.status_code == 200
-        
-        data = response.json()
-        # Verify sorted by relevance descending
-        scores = [job["relevance_score"] for job in data["results"] if job["relevance_score"]]
-        assert scores == sorted(scores, reverse=True)
+
+        check(response.json())
     
+###############################################################################################################
+class TestSearchPagination:
+    """Test paging through search results."""
+
     @pytest.mark.asyncio
     async def test_search_pagination(self, client):
         # Create many jobs for pagination testing
@@ -343,31 +311,19 @@ class TestJobSearch:
         ids_page1 = {job["job_id"] for job in data1["results"]}
         ids_page2 = {job["job_id"] for job in data2["results"]}
         assert len(ids_page1.intersection(ids_page2)) == 0
-    
-    @pytest.mark.asyncio
-    async def test_search_empty_results(self, client, sample_jobs):
-        await client.post("/jobs/ingest", json={"source": "manual", "jobs": sample_jobs})
-        
-        response = await client.get("/jobs/search?q=nonexistentquery12345")
-        assert response.status_code == 200
-        
-        data = response.json()
-        assert data["total"] == 0
-        assert len(data["results"]) == 0
 
 ###############################################################################################################
 class TestJobDetail:
     """Test job detail endpoint."""
     
+    @pytest.fixture(scope="class")
+    def db_connection(self, seeded_connection):
+        return seeded_connection
+    
     @pytest.mark.asyncio
-    async def test_get_job_by_id(self, client, sample_jobs):
-        # Ingest a job
-        await client.post("/jobs/ingest", json={"source": "manual", "jobs": [sample_jobs[0]]})
-        
-        # Search to get the job ID
-        search_response = await client.get("/jobs/search")
-        job_id = search_response.json()["results"][0]["job_id"]
-        
+    async def test_get_job_by_id(self, client, ingested_job_id):
+        job_id = ingested_job_id
+
         # Get job details
         response = await client.get(f"/jobs/{job_id}")
         assert response.status_code == 200
@@ -389,14 +345,9 @@ class TestJobDetail:
         assert "not found" in response.json()["detail"].lower()
     
     @pytest.mark.asyncio
-    async def test_get_job_with_application(self, client, sample_jobs):
-        # Ingest job
-        await client.post("/jobs/ingest", json={"source": "manual", "jobs": [sample_jobs[0]]})
-        
-        # Get job ID
-        search_response = await client.get("/jobs/search")
-        job_id = search_response.json()["results"][0]["job_id"]
-        
+    async def test_get_job_with_application(self, client, ingested_job_id):
+        job_id = ingested_job_id
+
         # Track application
         await client.post(f"/applications/{job_id}", json={
             "status": "Applied",
@@ -415,15 +366,14 @@ class TestJobDetail:
 class TestApplicationTracking:
     """Test application tracking endpoints."""
     
+    @pytest.fixture(scope="class")
+    def db_connection(self, seeded_connection):
+        return seeded_connection
+    
     @pytest.mark.asyncio
-    async def test_create_application(self, client, sample_jobs):
-        # Ingest job
-        await client.post("/jobs/ingest", json={"source": "manual", "jobs": [sample_jobs[0]]})
-        
-        # Get job ID
-        search_response = await client.get("/jobs/search")
-        job_id = search_response.json()["results"][0]["job_id"]
-        
+    async def test_create_application(self, client, ingested_job_id):
+        job_id = ingested_job_id
+
         # Create application
         response = await client.post(f"/applications/{job_id}", json={
             "status": "Applied",
@@ -438,23 +388,18 @@ class TestApplicationTracking:
         assert "job" in data
     
     @pytest.mark.asyncio
-    async def test_update_application(self, client, sample_jobs):
-        # Ingest job
-        await client.post("/jobs/ingest", json={"source": "manual", "jobs": [sample_jobs[0]]})
-        
-        # Get job ID
-        search_response = await client.get("/jobs/search")
-        job_id = search_response.json()["results"][0]["job_id"]
-        
+    async def test_update_application(self, client, ingested_job_id):
+        application_url = URL(f"/applications/{ingested_job_id}")
+
         # Create application
-        response1 = await client.post(f"/applications/{job_id}", json={
+        response1 = await client.post(application_url, json={
             "status": "Applied",
             "notes": "First note"
         })
         assert response1.status_code == 200
         
         # Update application
-        response2 = await client.post(f"/applications/{job_id}", json={
+        response2 = await client.post(application_url, json={
             "status": "Interview",
             "notes": "Updated note"
         })
@@ -474,10 +419,7 @@ class TestApplicationTracking:
         assert response.status_code == 404
     
     @pytest.mark.asyncio
-    async def test_get_all_applications(self, client, sample_jobs):
-        # Ingest jobs
-        await client.post("/jobs/ingest", json={"source": "manual", "jobs": sample_jobs})
-        
+    async def test_get_all_applications(self, client):
         # Get job IDs
         search_response = await client.get("/jobs/search")
         job_ids = [job["job_id"] for job in search_response.json()["results"]]
@@ -504,6 +446,19 @@ class TestApplicationTracking:
         assert "Applied" in statuses
         assert "Interview" in statuses
     
+    @pytest.mark.asyncio
+    async def test_application_refreshes_cached_search(self, client):
+        # first search fills the cache
+        search_response = await client.get(SEARCH_URL)
+        job_id = search_response.json()["results"][0]["job_id"]
+        assert search_response.json()["results"][0]["application_status"] is None
+        assert (await client.get(SEARCH_URL)).json() == search_response.json()
+
+        await client.post(f"/applications/{job_id}", json={"status": "Applied"})
+
+        search_response2 = await client.get(SEARCH_URL)
+        assert search_response2.json()["results"][0]["application_status"] == "Applied"
+    
     @pytest.mark.asyncio
     async def test_get_applications_empty(self, client):
         response = await client.get("/applications")
@@ -511,30 +466,25 @@ class TestApplicationTracking:
         assert response.json() == []
     
     @pytest.mark.asyncio
-    async def test_delete_application(self, client, sample_jobs):
-        # Ingest job
-        await client.post("/jobs/ingest", json={"source": "manual", "jobs": [sample_jobs[0]]})
-        
-        # Get job ID
-        search_response = await client.get("/jobs/search")
-        job_id = search_response.json()["results"][0]["job_id"]
-        
+    async def test_delete_application(self, client, ingested_job_id):
+        application_url = URL(f"/applications/{ingested_job_id}")
+
         # Create application
-        await client.post(f"/applications/{job_id}", json={
+        await client.post(application_url, json={
             "status": "Applied",
             "notes": "Test"
         })
         
         # Verify it exists
-        apps_response = await client.get("/applications")
+        apps_response = await client.get(APPLICATIONS_URL)
         assert len(apps_response.json()) == 1
         
         # Delete application
-        delete_response = await client.delete(f"/applications/{job_id}")
+        delete_response = await client.delete(application_url)
         assert delete_response.status_code == 200
         
         # Verify it's deleted
-        apps_response2 = await client.get("/applications")
+        apps_response2 = await client.get(APPLICATIONS_URL)
         assert len(apps_response2.json()) == 0
     
     @pytest.mark.asyncio
@@ -544,19 +494,14 @@ class TestApplicationTracking:
         assert response.status_code == 404
     
     @pytest.mark.asyncio
-    async def test_application_status_validation(self, client, sample_jobs):
-        # Ingest job
-        await client.post("/jobs/ingest", json={"source": "manual", "jobs": [sample_jobs[0]]})
-        
-        # Get job ID
-        search_response = await client.get("/jobs/search")
-        job_id = search_response.json()["results"][0]["job_id"]
-        
-        # Try invalid status
-        response = await client.post(f"/applications/{job_id}", json={
-            "status": "InvalidStatus",
-            "notes": "Test"
-        })
+    @pytest.mark.parametrize("payload", [
+        {"status": "InvalidStatus", "notes": "Test"},
+        # statuses are case sensitive
+        {"status": "applied"},
+        {"notes": "Missing status"},
+    ], ids=["unknown", "wrong_case", "missing"])
+    async def test_application_status_validation(self, client, ingested_job_id, payload):
+        response = await client.post(f"/applications/{ingested_job_id}", json=payload)
         assert response.status_code == 422  # Validation error
 
 ###############################################################################################################
@@ -566,14 +511,13 @@ class TestIntegrationScenarios:
     """Test complete user workflows."""
     
     @pytest.mark.asyncio
-    async def test_full_job_search_workflow(self, client, sample_jobs):
+    async def test_full_job_search_workflow(self, client, manual_ingest_body):
         """Test: User ingests jobs, searches, views details, tracks application."""
         
         # 1. Ingest jobs
-        ingest_response = await client.post("/jobs/ingest", json={
-            "source": "manual",
-            "jobs": sample_jobs
-        })
+        ingest_response = await client.post(
+            "/jobs/ingest", content=manual_ingest_body, headers=JSON_HEADERS
+        )
         assert ingest_response.status_code == 200
         assert ingest_response.json()["inserted"] == 3
         
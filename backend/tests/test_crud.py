@@ -1,10 +1,27 @@
 import pytest
 from datetime import date
-from app.crud import JobCRUD, ApplicationCRUD
+from app import crud
+from app.crud import JobCRUD, ApplicationCRUD, SearchCacheCRUD
 from app.schemas import JobSourceInput, ApplicationCreate, ApplicationUpdate
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
-from app.models import Job, Application
+from app.utils import description_fingerprint
+from sqlalchemy import select, delete, func
+from sqlalchemy.exc import OperationalError
+from app.models import Job, JobSource, Application, SearchCache, TermDocumentFrequency
+
+@pytest.fixture
+async def seeded_job(async_session) -> Job:
+    """A single ingested job for the application tests."""
+    await JobCRUD(async_session).ingest_jobs("linkedin", [JobSourceInput(
+        id="1",
+        source="linkedin",
+        title="Backend Engineer",
+        company="Meta",
+        description="APIs",
+        location="NYC",
+        url="z",
+        date_posted=date.today()
+    )])
+    return (await async_session.execute(select(Job))).scalar_one()
 
 @pytest.mark.asyncio
 async def test_ingest_job(async_session):
@@ -26,11 +43,12 @@ async def test_ingest_job(async_session):
     assert inserted == 1
     assert merged == 0
     
-    result = await async_session.execute(select(Job))
-    jobs = result.scalars().all()
+    # the job is still in the identity map, scalar_one checks it's the only row
+    stored = (await async_session.execute(select(Job))).scalar_one()
 
-    assert len(jobs) == 1
-    assert jobs[0].original_title == "Software Engineer"
+    assert stored.original_title == "Software Engineer"
+    assert stored.title_terms == {"software": 1, "engineer": 1}
+    assert stored.description_terms == {"build": 1, "ai": 1, "systems": 1}
 
 @pytest.mark.asyncio
 async def test_job_deduplication(async_session):
@@ -64,102 +82,334 @@ async def test_job_deduplication(async_session):
     assert inserted == 1
     assert merged2 == 1
 
-    result = await async_session.execute(
-        select(Job).options(selectinload(Job.sources))
+    job_obj = (await async_session.execute(select(Job))).scalar_one()
+    count = await async_session.scalar(
+        select(func.count()).select_from(JobSource).where(JobSource.job_id == job_obj.id)
     )
-    jobs = result.scalars().all()
-
-    assert len(jobs) == 1
-    assert len(jobs[0].sources) == 2
+    assert count == 2
 
 @pytest.mark.asyncio
-async def test_create_application(async_session):
+async def test_reworded_repost_is_merged(async_session):
     job_crud = JobCRUD(async_session)
-    app_crud = ApplicationCRUD(async_session)
 
-    job = JobSourceInput(
+    original = JobSourceInput(
         id="1",
         source="linkedin",
         title="Backend Engineer",
-        company="Meta",
-        description="APIs",
-        location="NYC",
-        url="z",
+        company="Stripe Inc",
+        description="Build payment infrastructure for the internet. Work with Ruby, "
+                    "Python, and modern databases. We're looking for someone "
+                    "passionate about APIs and distributed systems.",
+        location="Remote",
+        url="x",
         date_posted=date.today()
     )
+    repost = original.model_copy(update={
+        "id": "2",
+        "source": "indeed",
+        "company": "Stripe",
+        "description": "We're building payment infrastructure for the internet. "
+                       "You'll work on payments APIs using Ruby & Python and modern "
+                       "databases. Looking for someone passionate about APIs and "
+                       "distributed systems, 5+ yrs.",
+        "url": "y"
+    })
+
+    await job_crud.ingest_jobs("linkedin", [original])
+    inserted, merged = await job_crud.ingest_jobs("indeed", [repost])
+
+    assert (inserted, merged) == (0, 1)
 
-    await job_crud.ingest_jobs("linkedin", [job])
+@pytest.mark.asyncio
+async def test_empty_descriptions_not_merged(async_session):
+    job_crud = JobCRUD(async_session)
 
-    result = await async_session.execute(select(Job))
-    job_obj = result.scalar_one()
+    jobs = [
+        JobSourceInput(
+            id=job_id,
+            source="linkedin",
+            title="Data Engineer",
+            company="Stripe",
+            description="",
+            location="Remote",
+            url=job_id,
+            date_posted=date.today()
+        )
+        for job_id in ("2", "3")
+    ]
 
-    app = await app_crud.create_or_update(
-        job_obj.id,
-        ApplicationCreate(status = "Applied", notes = "First round")
+    inserted, merged = await job_crud.ingest_jobs("linkedin", jobs)
+
+    assert (inserted, merged) == (2, 0)
+
+@pytest.mark.asyncio
+async def test_fingerprint_match_still_needs_similar_description(async_session):
+    job_crud = JobCRUD(async_session)
+
+    original = JobSourceInput(
+        id="1",
+        source="linkedin",
+        title="Data Engineer",
+        company="Stripe",
+        description="Build batch pipelines in Spark and Airflow",
+        location="Remote",
+        url="x",
+        date_posted=date.today()
     )
+    other = original.model_copy(update={
+        "id": "2",
+        "source": "indeed",
+        "description": "Own the ledger reconciliation service in Go",
+        "url": "y"
+    })
+    await job_crud.ingest_jobs("linkedin", [original])
 
-    assert app.status == "Applied"
-    assert app.notes == "First round"
+    # boilerplate heavy postings can collide within a few bits
+    stored = (await async_session.execute(select(Job))).scalar_one()
+    stored.description_fingerprint = description_fingerprint(other.description)
+    await async_session.commit()
+
+    inserted, merged = await job_crud.ingest_jobs("indeed", [other])
+
+    assert (inserted, merged) == (1, 0)
 
 @pytest.mark.asyncio
-async def test_update_application(async_session):
+async def test_concurrently_claimed_job_hands_over_merged_sources(async_session, monkeypatch):
     job_crud = JobCRUD(async_session)
-    app_crud = ApplicationCRUD(async_session)
 
-    job = JobSourceInput(
+    posting = JobSourceInput(
         id="1",
         source="linkedin",
-        title="ML Engineer",
-        company="OpenAI",
-        description="Models",
+        title="Data Platform Engineer",
+        company="Stripe",
+        description="Build pipelines",
         location="Remote",
         url="x",
         date_posted=date.today()
     )
+    await job_crud.ingest_jobs("linkedin", [posting])
+    winner = (await async_session.execute(select(Job))).scalar_one()
+
+    # another ingest claims "1" between the existence check and the insert,
+    # after the batch built a new job for it that "2" then merges into
+    async def no_existing_ids(source, source_job_ids):
+        return set()
+    monkeypatch.setattr(job_crud, "_get_existing_source_ids", no_existing_ids)
+
+    batch = [
+        posting.model_copy(update={"title": "Data Engineer"}),
+        posting.model_copy(update={"id": "2", "title": "Data Engineer", "url": "y"}),
+    ]
+    inserted, merged = await job_crud.ingest_jobs("linkedin", batch)
+
+    assert (inserted, merged) == (0, 1)
+    assert (await async_session.execute(select(Job))).scalar_one().id == winner.id
+    job_ids = await async_session.scalars(select(JobSource.job_id))
+    assert set(job_ids) == {winner.id}
 
-    await job_crud.ingest_jobs("linkedin", [job])
+@pytest.mark.asyncio
+async def test_create_application(async_session, seeded_job):
+    app_crud = ApplicationCRUD(async_session)
 
-    result = await async_session.execute(select(Job))
-    job_obj = result.scalar_one()
+    app = await app_crud.create_or_update(
+        seeded_job.id,
+        ApplicationCreate(status = "Applied", notes = "First round")
+    )
+
+    assert app.status == "Applied"
+    assert app.notes == "First round"
+
+@pytest.mark.asyncio
+async def test_update_application(async_session, seeded_job):
+    app_crud = ApplicationCRUD(async_session)
 
     await app_crud.create_or_update(
-        job_obj.id,
+        seeded_job.id,
         ApplicationCreate(status="Applied")
     )
 
     updated = await app_crud.update(
-        job_obj.id,
+        seeded_job.id,
         ApplicationUpdate(status="Interview")
     )
 
     assert updated.status == "Interview"
 
 @pytest.mark.asyncio
-async def test_delete_application(async_session):
-    job_crud = JobCRUD(async_session)
+async def test_delete_application(async_session, seeded_job):
     app_crud = ApplicationCRUD(async_session)
 
+    await app_crud.create_or_update(
+        seeded_job.id,
+        ApplicationCreate(status="Applied")
+    )
+
+    deleted = await app_crud.delete(seeded_job.id)
+
+    assert deleted is True
+
+@pytest.mark.asyncio
+async def test_ingest_skips_repeated_source_id(async_session):
+    job_crud = JobCRUD(async_session)
+
     job = JobSourceInput(
         id="1",
         source="linkedin",
-        title="Backend Engineer",
-        company="Stripe",
-        description="APIs",
+        title="Platform Engineer",
+        company="Datadog",
+        description="Run infrastructure",
         location="Remote",
-        url="y",
+        url="x",
         date_posted=date.today()
     )
 
-    await job_crud.ingest_jobs("linkedin", [job])
+    inserted, merged = await job_crud.ingest_jobs("linkedin", [job, job])
+    inserted2, merged2 = await job_crud.ingest_jobs("linkedin", [job])
 
-    result = await async_session.execute(select(Job))
-    job_obj = result.scalar_one()
+    assert (inserted, merged) == (1, 0)
+    assert (inserted2, merged2) == (0, 0)
+
+    count = await async_session.scalar(select(func.count()).select_from(JobSource))
+    assert count == 1
+
+@pytest.mark.asyncio
+async def test_create_or_update_keeps_notes(async_session, seeded_job):
+    app_crud = ApplicationCRUD(async_session)
 
     await app_crud.create_or_update(
-        job_obj.id,
-        ApplicationCreate(status="Applied")
+        seeded_job.id,
+        ApplicationCreate(status="Applied", notes="Referral")
     )
+    app = await app_crud.create_or_update(
+        seeded_job.id,
+        ApplicationCreate(status="Interview")
+    )
+
+    assert app.status == "Interview"
+    assert app.notes == "Referral"
+
+    count = await async_session.scalar(select(func.count()).select_from(Application))
+    assert count == 1
+
+@pytest.mark.asyncio
+async def test_ingest_commits_in_chunks(async_session, monkeypatch):
+    monkeypatch.setattr(crud, "INGEST_CHUNK_SIZE", 2)
+    job_crud = JobCRUD(async_session)
+
+    jobs = [
+        JobSourceInput(
+            id=str(i),
+            source="indeed",
+            title=f"Engineer {i}",
+            company="Shopify",
+            description=f"Team {i}",
+            location="Remote",
+            url=f"https://indeed.com/{i}",
+            date_posted=date.today()
+        )
+        for i in range(4)
+    ]
+    # same posting as the first job, lands in a later chunk
+    jobs.append(jobs[0].model_copy(update={"id": "repost"}))
+
+    inserted, merged = await job_crud.ingest_jobs("indeed", jobs)
+
+    assert (inserted, merged) == (4, 1)
+
+@pytest.mark.asyncio
+async def test_ingest_counts_document_frequencies(async_session, monkeypatch):
+    monkeypatch.setattr(crud, "TERM_DF_PAGE_SIZE", 2)
+    job_crud = JobCRUD(async_session)
+
+    jobs = [
+        JobSourceInput(
+            id=str(i),
+            source="indeed",
+            title=title,
+            company=company,
+            description=description,
+            location="Remote",
+            url=f"https://indeed.com/{i}",
+            date_posted=date.today()
+        )
+        for i, (company, title, description) in enumerate([
+            ("Shopify", "Python Engineer", "Python python services"),
+            ("Stripe", "Go Engineer", "Payments in Go"),
+        ])
+    ]
+    await job_crud.ingest_jobs("indeed", jobs)
+    # second ingest of a new job increments the existing rows
+    await job_crud.ingest_jobs("indeed", [jobs[0].model_copy(update={
+        "id": "2", "company": "Plaid", "description": "Ledger engineer"
+    })])
+
+    result = await async_session.execute(select(TermDocumentFrequency))
+    df = {stat.term: stat.df for stat in result.scalars().all()}
+
+    assert df["engineer"] == 3
+    assert df["python"] == 2
+    assert df["payments"] == 1
+
+@pytest.mark.asyncio
+async def test_description_terms_are_capped(async_session, monkeypatch):
+    monkeypatch.setattr(crud.settings, "description_terms_max_chars", 20)
+    job_crud = JobCRUD(async_session)
+
+    await job_crud.ingest_jobs("indeed", [JobSourceInput(
+        id="1",
+        source="indeed",
+        title="Engineer",
+        company="Shopify",
+        description="Ruby on Rails team " + "filler " * 50 + "kubernetes",
+        location="Remote",
+        url="https://indeed.com/1",
+        date_posted=date.today()
+    )])
+
+    job = (await async_session.execute(select(Job))).scalar_one()
+    assert "ruby" in job.description_terms
+    assert "kubernetes" not in job.description_terms
+
+@pytest.mark.asyncio
+async def test_search_cache_drops_local_copy_cleared_elsewhere(async_session, monkeypatch):
+    cache = SearchCacheCRUD(async_session)
+    params = {"query": "python", "page": 1}
+
+    await cache.set(params, {"total": 1})
+
+    # another process clearing the cache only removes the table rows
+    await async_session.execute(delete(SearchCache))
+    await async_session.commit()
+
+    # within the local ttl the copy is served without asking the table
+    assert await cache.get(params) == {"total": 1}
 
-    deleted = await app_crud.delete(job_obj.id)
+    monkeypatch.setattr(crud.settings, "search_cache_local_ttl_seconds", 0)
+    assert await cache.get(params) is None
+    assert cache.query_hash(params) not in crud._local_search_cache
 
-    assert deleted is True
\ No newline at end of file
+@pytest.mark.asyncio
+async def test_search_cache_write_failure_is_not_raised(async_session, monkeypatch):
+    cache = SearchCacheCRUD(async_session)
+
+    async def failing_execute(*args, **kwargs):
+        raise OperationalError("INSERT", {}, Exception("database is locked"))
+    monkeypatch.setattr(async_session, "execute", failing_execute)
+
+    await cache.set({"page": 1}, {"page": 1})
+
+    assert cache.query_hash({"page": 1}) not in crud._local_search_cache
+
+@pytest.mark.asyncio
+async def test_search_cache_local_copies_are_bounded(async_session, monkeypatch):
+    monkeypatch.setattr(crud.settings, "search_cache_local_max_entries", 2)
+    cache = SearchCacheCRUD(async_session)
+
+    for page in (1, 2, 3):
+        await cache.set({"page": page}, {"page": page})
+
+    assert list(crud._local_search_cache) == [
+        cache.query_hash({"page": 2}), cache.query_hash({"page": 3})
+    ]
+    # evicted locally, still served from the table
+    assert await cache.get({"page": 1}) == {"page": 1}
@@ -1,10 +1,18 @@
 import pytest
+from hashlib import blake2b
 from app.utils import (
     normalize_company,
     normalize_title,
     is_duplicate_job,
-    calculate_text_similarity
+    calculate_text_similarity,
+    description_shingles,
+    shingle_similarity,
+    description_fingerprint,
+    fingerprint_distance,
+    preprocess_job,
+    tokenize_for_search
 )
+from app.init_db import _renormalized_company
 
 class TestCompanyNormalization:
     """Test company name normalization."""
@@ -27,7 +35,25 @@ class TestCompanyNormalization:
 
     def test_lowercase_and_trim(self):
         assert normalize_company("   NETFLIX    ") == "netflix"
-    
+
+    def test_removes_stacked_suffixes(self):
+        assert normalize_company("Acme Co Inc") == "acme"
+        assert normalize_company("Coco") == "coco"
+
+    def test_removes_comma_separated_suffix(self):
+        assert normalize_company("Stripe,Inc.") == "stripe"
+        assert normalize_company("Acme, Co., Ltd.") == "acme"
+
+    def test_renormalizes_from_original_name(self):
+        assert _renormalized_company("stripeinc", "Stripe,Inc.") == "stripe"
+        assert _renormalized_company("foo inc", "Foo Inc Co") == "foo"
+
+    def test_renormalizes_stored_name_without_guessing(self):
+        # jobs ingested before the original name was kept
+        assert _renormalized_company("foo inc") == "foo"
+        assert _renormalized_company("stripeinc") == "stripeinc"
+        assert _renormalized_company("metacorp") == "metacorp"
+
 class TestTitleNormalization:
     """Test job title normalization."""
 
@@ -61,6 +87,92 @@ class TestTextSimilarity:
         )
         assert similarity < 0.5
 
+    def test_length_bound_below_threshold(self):
+        # 2 * 3 / (3 + 17) = 0.3, the edit distance is never computed
+        similarity = calculate_text_similarity(
+            "swe", "software engineer", min_threshold = 0.75
+        )
+        assert similarity == 0.0
+
+    def test_below_threshold_scores_zero(self):
+        # same length, so only the distance budget rules the pair out
+        assert calculate_text_similarity(
+            "data engineer", "sales manager", min_threshold = 0.75
+        ) == 0.0
+        assert calculate_text_similarity(
+            "data engineer", "data engineers", min_threshold = 0.75
+        ) > 0.75
+
+class TestShingleSimilarity:
+    """Test shingle based description similarity."""
+
+    def test_identical_text(self):
+        shingles = description_shingles("build scalable systems")
+        assert shingle_similarity(shingles, shingles) == 1.0
+
+    def test_reordered_sentences_stay_similar(self):
+        a = description_shingles("we build apis in python. we deploy on kubernetes.")
+        b = description_shingles("we deploy on kubernetes. we build apis in python.")
+        assert shingle_similarity(a, b) > 0.8
+
+    def test_different_text(self):
+        a = description_shingles("react and javascript")
+        b = description_shingles("python, azure, and power bi")
+        assert shingle_similarity(a, b) < 0.2
+
+    def test_short_and_empty_text(self):
+        assert len(description_shingles("abc")) == 1
+        assert shingle_similarity(description_shingles(""), description_shingles("abc")) == 0.0
+
+class TestDescriptionFingerprint:
+    """Test SimHash description fingerprints."""
+
+    def test_identical_descriptions(self):
+        desc = "Build payment APIs with Ruby and Python."
+        assert description_fingerprint(desc) == description_fingerprint(desc)
+
+    def test_case_and_punctuation_ignored(self):
+        assert fingerprint_distance(
+            description_fingerprint("Build payment APIs with Ruby and Python."),
+            description_fingerprint("build payment apis with ruby and python")
+        ) == 0
+
+    def test_different_descriptions_far_apart(self):
+        assert fingerprint_distance(
+            description_fingerprint("React and Javascript"),
+            description_fingerprint("Python, Azure, and Power BI")
+        ) > 3
+
+    def test_no_tokens_no_fingerprint(self):
+        assert description_fingerprint("") is None
+        assert description_fingerprint(" -- ") is None
+        assert preprocess_job("Stripe", "Engineer", " -- ").fingerprint is None
+
+    def test_fits_signed_bigint(self):
+        fingerprint = description_fingerprint("Lead development of React applications.")
+        assert -(1 << 63) <= fingerprint < (1 << 63)
+
+    def test_matches_per_bit_majority(self):
+        desc = "Python python Go services, Kubernetes and Go tooling"
+        hashes = [
+            int.from_bytes(blake2b(token.encode(), digest_size = 8).digest(), "big")
+            for token in tokenize_for_search(desc)
+        ]
+        expected = 0
+        for bit in range(64):
+            if 2 * sum(h >> bit & 1 for h in hashes) > len(hashes):
+                expected |= 1 << bit
+
+        assert description_fingerprint(desc) & 0xFFFFFFFFFFFFFFFF == expected
+
+    def test_preprocess_matches_fingerprint(self):
+        desc = "  Lead development of React applications.  "
+        job = preprocess_job("Stripe, Inc.", "Sr. SWE", desc)
+        assert job.normalized_company == "stripe"
+        assert job.normalized_title == "senior software engineer"
+        assert job.description_head == desc.lower().strip()
+        assert job.fingerprint == description_fingerprint(desc)
+
 class TestJobDeduplication:
     """Test job deduplication logic."""
 
@@ -72,6 +184,23 @@ class TestJobDeduplication:
         assert is_dup
         assert score > 0.9
 
+    def test_identical_repost_scores_one(self):
+        is_dup, score = is_duplicate_job(
+            "Stripe", "Sr. Engineer", "  Build payments  ",
+            "Stripe, Inc.", "Senior Engineer", "build payments"
+        )
+        assert (is_dup, score) == (True, 1.0)
+
+    def test_empty_repost_not_duplicate(self):
+        assert is_duplicate_job(
+            "Stripe", "Engineer", "   ",
+            "Stripe", "Engineer", ""
+        ) == (False, 0.0)
+        assert is_duplicate_job(
+            "Stripe", "!!", "Build payments",
+            "Stripe", "??", "Build payments"
+        ) == (False, 0.0)
+
     def test_similar_titles_same_company(self):
         is_dup, score = is_duplicate_job(
             "Meta", "Software Engineer", "Work on React",
@@ -93,6 +222,17 @@ class TestJobDeduplication:
         )
         assert not is_dup
 
+    def test_title_mismatch_reports_title_similarity(self):
+        is_dup, score = is_duplicate_job(
+            "Google", "Software Engineer", "Backend work",
+            "Google", "Data Scientist", "Backend work"
+        )
+        assert not is_dup
+        assert score == pytest.approx(
+            calculate_text_similarity("software engineer", "data scientist")
+        )
+        assert score > 0.3
+
     def test_same_company_same_title_different_desc(self):
         is_dup, score = is_duplicate_job(
             "Google", "Software Engineer", "React and Javascript",
@@ -109,4 +249,39 @@ class TestJobDeduplication:
             "Stripe", "Senior Backend Engineer", desc
         )
         # Should be duplicate due to high combined score
-        assert is_dup or score > 0.6
\ No newline at end of file
+        assert is_dup or score > 0.6
+
+    def test_reworded_repost_is_duplicate(self):
+        is_dup, score = is_duplicate_job(
+            "Stripe Inc", "Backend Engineer",
+            "Build payment infrastructure for the internet. Work with Ruby, Python, "
+            "and modern databases. We're looking for someone passionate about APIs "
+            "and distributed systems.",
+            "Stripe", "Backend Engineer",
+            "We're building payment infrastructure for the internet. You'll work on "
+            "payments APIs using Ruby & Python and modern databases. Looking for "
+            "someone passionate about APIs and distributed systems, 5+ yrs."
+        )
+        assert is_dup
+        assert score > 0.5
+
+    def test_different_role_same_template_not_duplicate(self):
+        is_dup, score = is_duplicate_job(
+            "Airbnb", "Software Engineer",
+            "Create amazing user experiences with React and TypeScript. Join our "
+            "frontend team to build the next generation of travel products. Strong "
+            "CSS and design skills required.",
+            "Airbnb", "Software Engineer",
+            "Create reliable payment experiences with Java and Kotlin. Join our "
+            "payments team to build the next generation of host payouts. Strong "
+            "SQL and finance domain skills required."
+        )
+        assert not is_dup
+
+    def test_length_mismatch_not_duplicate(self):
+        is_dup, score = is_duplicate_job(
+            "Google", "Software Engineer", "Build stuff",
+            "Google", "Software Engineer", "Build stuff " + "and more stuff " * 20
+        )
+        assert not is_dup
+        assert score == 0.0
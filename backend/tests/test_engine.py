@@ -1,10 +1,21 @@
 import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.search import JobSearchEngine
 from app.models import Job
+from app.utils import term_frequencies
 from datetime import datetime, UTC, timedelta
 
-@pytest.fixture
-async def sample_jobs(async_session):
+@pytest.fixture(scope="module")
+async def db_connection(engine):
+    # one connection for the module so sample_jobs is inserted once,
+    # each test still rolls back to its own savepoint
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        yield conn
+        await transaction.rollback()
+
+@pytest.fixture(scope="module")
+async def sample_jobs(db_connection):
     now = datetime.now(UTC)
     jobs = [
         Job(
@@ -33,8 +44,13 @@ async def sample_jobs(async_session):
         ),
     ]
 
-    async_session.add_all(jobs)
-    await async_session.commit()
+    async with AsyncSession(
+        bind=db_connection,
+        expire_on_commit=False,
+        join_transaction_mode="create_savepoint"
+    ) as session:
+        session.add_all(jobs)
+        await session.commit()
 
     return jobs
 
@@ -81,4 +97,70 @@ async def test_pagination(async_session, sample_jobs):
     results_page_2, _ = await engine.search(page = 2, page_size = 1)
 
     assert total >= 2
-    assert results_page_1[0][0].id != results_page_2[0][0].id
\ No newline at end of file
+    assert results_page_1[0][0].id != results_page_2[0][0].id
+
+@pytest.mark.asyncio
+async def test_page_past_the_end_keeps_total(async_session, sample_jobs):
+    engine = JobSearchEngine(async_session)
+    _, total = await engine.search(page_size = 1)
+
+    results, past_end_total = await engine.search(page = total + 1, page_size = 1)
+
+    assert results == []
+    assert past_end_total == total
+
+@pytest.mark.asyncio
+async def test_exclusion_matches_whole_tokens(async_session, sample_jobs):
+    engine = JobSearchEngine(async_session)
+    results, total = await engine.search(query = "python -script")
+
+    # "scripting" is not the excluded token "script"
+    assert total == 2
+
+@pytest.mark.asyncio
+async def test_pages_follow_full_ordering(async_session, sample_jobs):
+    engine = JobSearchEngine(async_session)
+    everything, total = await engine.search(query = "developer", page_size = 10)
+
+    paged = []
+    for page in range(1, total + 1):
+        results, _ = await engine.search(query = "developer", page = page, page_size = 1)
+        paged.extend(results)
+
+    assert [job.id for job, _ in paged] == [job.id for job, _ in everything]
+
+@pytest.mark.asyncio
+async def test_company_filter_normalizes_input(async_session, sample_jobs):
+    engine = JobSearchEngine(async_session)
+    results, total = await engine.search(company = "ACME Inc.")
+
+    assert total == 1
+    assert results[0][0].normalized_company == "acme"
+
+@pytest.mark.asyncio
+async def test_exclusion_only_query(async_session, sample_jobs):
+    engine = JobSearchEngine(async_session)
+    results, total = await engine.search(query = "-python")
+
+    assert total == 1
+    assert results[0][0].original_title == "Senior Java Engineer"
+
+@pytest.mark.asyncio
+async def test_exclusion_checks_past_stored_terms(async_session, sample_jobs):
+    description = "Python services. " * 300 + "Senior level role."
+    async_session.add(Job(
+        original_title="Python Platform Engineer",
+        normalized_title="python platform engineer",
+        description=description,
+        # stored terms stop at description_terms_max_chars like at ingest
+        description_terms=term_frequencies(description[:4000]),
+        normalized_company="hooli",
+        location="Remote",
+        date_posted=datetime.now(UTC),
+    ))
+
+    engine = JobSearchEngine(async_session)
+    results, total = await engine.search(query = "python -senior")
+
+    assert total == 2
+    assert "Python Platform Engineer" not in [job.original_title for job, _ in results]
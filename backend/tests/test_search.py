@@ -7,12 +7,12 @@ class TestSearchParsing:
     def test_simple_query(self):
         query, exclusions = extract_exclusion_terms("python")
         assert query == "python"
-        assert exclusions == []
+        assert exclusions == ()
 
     def test_single_exclusion(self):
         query, exclusions = extract_exclusion_terms("python -senior")
         assert query == "python"
-        assert exclusions == ["senior"]
+        assert exclusions == ("senior",)
 
     def test_multiple_exclusions(self):
         query, exclusions = extract_exclusion_terms("react -remote -contract -senior")
@@ -29,21 +29,30 @@ class TestSearchParsing:
         assert query == ""
         assert set(exclusions) == {"python", "junior"}
 
+    def test_hyphenated_word_is_not_excluded(self):
+        query, exclusions = extract_exclusion_terms("full-stack -senior")
+        assert query == "full-stack"
+        assert exclusions == ("senior",)
+
 class TestTokenization:
     """Test search tokenization."""
 
     def test_simple_tokenization(self):
         tokens = tokenize_for_search("Software Engineer")
-        assert tokens == ["software", "engineer"]
+        assert tokens == ("software", "engineer")
 
     def test_removes_special_characters(self):
         tokens = tokenize_for_search("Full-stack Developer")
-        assert tokens == ["full", "stack", "developer"]
+        assert tokens == ("full", "stack", "developer")
 
     def test_handles_numbers(self):
         tokens = tokenize_for_search("Python 3.9 Developer")
-        assert tokens == ["python", "3.9", "developer"]
+        assert tokens == ("python", "3.9", "developer")
 
     def test_empty_string(self):
         tokens = tokenize_for_search("")
-        assert tokens == []
\ No newline at end of file
+        assert tokens == ()
+
+    def test_unicode_words(self):
+        tokens = tokenize_for_search("Développeur Backend, Zürich")
+        assert tokens == ("développeur", "backend", "zürich")
\ No newline at end of file